@@ -0,0 +1,245 @@
+import os
+import sys
+import math
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from bench.fake_server import FakeUpstream, add_fault_args, faults_from_args
+
+# Drives the MrSpreadsheet command handlers against the stand-in server:
+#   python -m bench.benchmark --servers 20 --iterations 10 --commands report,show
+# Discord is never reached, every ctx.send is kept in memory.
+
+SHEET = "bench"
+
+
+class FakeGuild(NamedTuple):
+    id: int
+
+
+class FakeChannel(NamedTuple):
+    id: int
+
+
+class FakeContext(object):
+    def __init__(self, srvr: int, channel: int) -> None:
+        self.guild = FakeGuild(srvr)
+        self.channel = FakeChannel(channel)
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append((content, kwargs))
+
+
+class FakeBot(object):
+    def __init__(self, srvrs: List[int]) -> None:
+        self.guilds = [FakeGuild(srvr) for srvr in srvrs]
+        self.loop = asyncio.get_event_loop()
+
+
+class Result(NamedTuple):
+    command: str
+    calls: int
+    errors: int
+    p50: float
+    p99: float
+    throughput: float
+    peak_rss_mb: float
+
+
+def configure(url: str, workdir: str, rate_limits: bool):
+    # The bot reads its config when imported, it has to be set first
+    os.environ["SWGOH_API"] = f"{url}/api/"
+    os.environ["MRLOBOT_ENDPOINT"] = f"{url}/storage/"
+    os.environ["CATALOG_SNAPSHOT"] = os.path.join(workdir, "catalog.pkl")
+    os.environ["SRVR_CACHE_PATH"] = os.path.join(workdir, "srvr_guilds.sqlite")
+
+    if not rate_limits:
+        for name in ["SCHEDULER_SERVER_BURST", "SCHEDULER_SERVER_PER_MINUTE",
+                     "SCHEDULER_GUILD_BURST", "SCHEDULER_GUILD_PER_MINUTE"]:
+            os.environ.setdefault(name, "1000000")
+
+
+def percentile(values: List[float], p: float) -> float:
+    # Nearest rank
+    if len(values) == 0:
+        return float("nan")
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def peak_rss_mb() -> float:
+    # Peak of the whole process, ru_maxrss is in KB on linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def rss_mb() -> Optional[float]:
+    # Current resident memory, None where there is no /proc
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RssSampler(object):
+    # Peak resident memory while a command runs. Sampled from a thread, the
+    # loop can be too busy to do it on time.
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.peak = rss_mb()
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__sample, name="rss", daemon=True)
+
+    def __sample(self):
+        while not self.__stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self):
+        if self.peak is not None:
+            self.__thread.start()
+        return self
+
+    def __exit__(self, *_):
+        if self.peak is None:
+            # Without /proc only the peak of the whole run is known
+            self.peak = peak_rss_mb()
+            return
+
+        self.__stop.set()
+        self.__thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+def make_commands(cog, stats: str, fmt: str, refresh: bool) -> Dict[str, Callable]:
+    to_report = ", ".join([stats, fmt] + (["refresh"] if refresh else []))
+
+    return {
+        "report": lambda ctx: cog.mrlobot_reportsheet.callback(cog, ctx, SHEET, to_report=to_report),
+        "show": lambda ctx: cog.mrlobot_showsheet.callback(cog, ctx, "*"),
+        "list": lambda ctx: cog.mrlobot_listchars.callback(cog, ctx, None),
+        "changes": lambda ctx: cog.mrlobot_changes.callback(cog, ctx),
+    }
+
+
+async def seed(cog, srvrs: List[int], guilds: int, sheet_chars: int):
+    # Through the storage routes, so an external stand-in works as well
+    char_ids = sorted(cog.chars.id_names)[:sheet_chars]
+
+    for ix, srvr in enumerate(srvrs):
+        guild = str(ix % guilds)
+        await cog.mrlobot_storage.register_guild(srvr, guild)
+        if ix < guilds:
+            await cog.mrlobot_storage.add_to_spreadsheet(SHEET, guild, char_ids)
+
+
+async def run_command(name: str, command: Callable, srvrs: List[int], iterations: int) -> Result:
+    latencies = []
+    errors = 0
+
+    async def server_loop(srvr):
+        nonlocal errors
+
+        for ix in range(iterations):
+            ctx = FakeContext(srvr, channel=srvr * 1000 + ix)
+            start = time.perf_counter()
+            try:
+                await command(ctx)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*[server_loop(srvr) for srvr in srvrs])
+        elapsed = time.perf_counter() - start
+
+    return Result(command=name,
+                  calls=len(latencies),
+                  errors=errors,
+                  p50=percentile(latencies, 50),
+                  p99=percentile(latencies, 99),
+                  throughput=len(latencies) / elapsed,
+                  peak_rss_mb=rss.peak)
+
+
+async def run(args: argparse.Namespace) -> List[Result]:
+    runner = None
+    url = args.url
+
+    if url is None:
+        upstream = FakeUpstream(swgoh_fault=faults_from_args(args, "swgoh"),
+                                storage_fault=faults_from_args(args, "storage"),
+                                fixtures=args.fixtures,
+                                players=args.players,
+                                units=args.units)
+        runner = await upstream.start(port=args.port)
+        url = f"http://127.0.0.1:{args.port}"
+
+    workdir = tempfile.mkdtemp(prefix="mrlobot_bench_")
+    configure(url, workdir, args.rate_limits)
+
+    from cogs.mrspreadsheets import MrSpreadsheet
+
+    srvrs = [1000 + ix for ix in range(args.servers)]
+    cog = MrSpreadsheet(FakeBot(srvrs))
+    results = []
+
+    try:
+        # Seeded before on_ready, its warmup would cache the servers as empty
+        cog.chars = await cog.swgoh.get_chars()
+        await seed(cog, srvrs, args.guilds, args.sheet_chars)
+        await cog.on_ready()
+
+        commands = make_commands(cog, args.stats, args.format, args.refresh)
+        for name in args.commands.split(","):
+            results.append(await run_command(name, commands[name], srvrs, args.iterations))
+    finally:
+        cog.cog_unload()
+        # Lets the client close before the loop goes away
+        await asyncio.sleep(0.1)
+        if runner is not None:
+            await runner.cleanup()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark of the MrSpreadsheet commands")
+    parser.add_argument("--url", help="External stand-in server, one is started in process otherwise")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", help="Directory with recorded characters.json and guild_{id}.json")
+    parser.add_argument("--servers", type=int, default=10, help="Concurrent Discord servers")
+    parser.add_argument("--guilds", type=int, default=5, help="swgoh guilds shared by the servers")
+    parser.add_argument("--iterations", type=int, default=5, help="Calls per server and command")
+    parser.add_argument("--commands", default="report,show,list,changes")
+    parser.add_argument("--stats", default="pg, relic")
+    parser.add_argument("--format", default="csv", choices=["csv", "xlsx", "zip"])
+    parser.add_argument("--refresh", action="store_true", help="Skip the guild cache on every report")
+    parser.add_argument("--rate-limits", action="store_true", help="Keep the scheduler rate limits")
+    parser.add_argument("--sheet-chars", type=int, default=30)
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--units", type=int, default=150)
+    add_fault_args(parser)
+    args = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(run(args))
+
+    print(f"{'command':<10} {'calls':>6} {'errors':>6} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'calls/s':>9} {'peak MB':>9}")
+    for result in results:
+        print(f"{result.command:<10} {result.calls:>6} {result.errors:>6} "
+              f"{result.p50 * 1000:>9.1f} {result.p99 * 1000:>9.1f} "
+              f"{result.throughput:>9.1f} {result.peak_rss_mb:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import json
+import random
+import asyncio
+import hashlib
+import argparse
+
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from aiohttp import web
+
+from bench.payloads import make_characters, make_guild
+
+# Stand-in for swgoh.gg (/api/) and the MrLobot storage (/storage/), point
+# SWGOH_API and MRLOBOT_ENDPOINT to it:
+#   python -m bench.fake_server --port 8080 --swgoh-latency 0.2 --swgoh-error-rate 0.05
+#   SWGOH_API=http://localhost:8080/api/ MRLOBOT_ENDPOINT=http://localhost:8080/storage/
+
+SWGOH_PREFIX = "/api/"
+STORAGE_PREFIX = "/storage/"
+
+
+class Fault(NamedTuple):
+    # Seconds added to every response, plus a uniform random jitter
+    latency: float = 0
+    jitter: float = 0
+    # Share of the requests answered with error_status instead
+    error_rate: float = 0
+    error_status: int = 502
+
+
+class FakeUpstream(object):
+    def __init__(self,
+                 swgoh_fault: Fault = Fault(),
+                 storage_fault: Fault = Fault(),
+                 fixtures: Optional[str] = None,
+                 chars: int = 250,
+                 players: int = 50,
+                 units: int = 150,
+                 null_power: float = 0,
+                 seed: int = 0) -> None:
+        self.faults = {SWGOH_PREFIX: swgoh_fault,
+                       STORAGE_PREFIX: storage_fault}
+        self.players = players
+        self.units = units
+        self.null_power = null_power
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        # Recorded payloads are served as they are: characters.json, guild_{id}.json
+        self.fixtures = Path(fixtures) if fixtures else None
+        self.characters_payload = self.__fixture("characters.json") or \
+            json.dumps(make_characters(chars, seed)).encode()
+        self.etag = f'"{hashlib.md5(self.characters_payload).hexdigest()}"'
+        self.guilds: Dict[str, bytes] = {}
+
+        # Storage state
+        self.srvr_guilds: Dict[str, str] = {}
+        self.sheets: Dict[str, Dict[str, List[int]]] = {}
+
+        self.requests = Counter()
+
+    # region aux functions
+    def __fixture(self, name: str) -> Optional[bytes]:
+        if self.fixtures is None or not (self.fixtures / name).exists():
+            return None
+        return (self.fixtures / name).read_bytes()
+
+    def __guild_payload(self, guild: str) -> bytes:
+        if guild not in self.guilds:
+            chars = json.loads(self.characters_payload)
+            self.guilds[guild] = self.__fixture(f"guild_{guild}.json") or \
+                json.dumps(make_guild(guild, chars,
+                                      players=self.players,
+                                      units=self.units,
+                                      seed=self.seed,
+                                      null_power=self.null_power)).encode()
+        return self.guilds[guild]
+
+    def __ok(self, content, message: str = "ok") -> web.Response:
+        return web.json_response({"ok": True, "message": message, "content": content})
+
+    def __not_ok(self, content, message: str) -> web.Response:
+        return web.json_response({"ok": False, "message": message, "content": content})
+
+    async def __body(self, request: web.Request) -> dict:
+        text = await request.text()
+        return json.loads(text) if text else {}
+
+    @web.middleware
+    async def __faults(self, request: web.Request, handler):
+        prefix = next((prefix for prefix in self.faults if request.path.startswith(prefix)), None)
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else request.path
+        self.requests[f"{request.method} {route}"] += 1
+
+        if prefix is not None:
+            fault = self.faults[prefix]
+            delay = fault.latency + self.random.uniform(0, fault.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.random.random() < fault.error_rate:
+                return web.Response(status=fault.error_status,
+                                    text=f"Injected {fault.error_status}")
+
+        return await handler(request)
+    # endregion
+
+    # region swgoh.gg
+    async def characters(self, request: web.Request) -> web.Response:
+        if request.headers.get("If-None-Match") == self.etag:
+            return web.Response(status=304, headers={"ETag": self.etag})
+
+        return web.Response(body=self.characters_payload,
+                            content_type="application/json",
+                            headers={"ETag": self.etag})
+
+    async def guild(self, request: web.Request) -> web.Response:
+        guild = request.match_info["guild"]
+        return web.Response(body=self.__guild_payload(guild),
+                            content_type="application/json")
+    # endregion
+
+    # region storage
+    async def register(self, request: web.Request) -> web.Response:
+        payload = await self.__body(request)
+        srvr, guild = payload["server"], payload["guild"]
+
+        if srvr in self.srvr_guilds:
+            return web.json_response({"errorType": "ConditionalCheckFailedException",
+                                      "errorMessage": f"{srvr} already has a guild"})
+
+        self.srvr_guilds[srvr] = guild
+        return self.__ok({})
+
+    async def srvrs(self, request: web.Request) -> web.Response:
+        srvr = request.match_info["srvr"]
+        items = [{"srvr": srvr, "guild": self.srvr_guilds[srvr]}] \
+            if srvr in self.srvr_guilds else []
+
+        return self.__ok({"items": items})
+
+    async def add_to_spreadsheet(self, request: web.Request) -> web.Response:
+        sheet = request.match_info["sheet"]
+        payload = await self.__body(request)
+        sheets = self.sheets.setdefault(payload["guild"], {})
+
+        is_new = sheet not in sheets
+        current = sheets.setdefault(sheet, [])
+        new = [char for char in payload["chars"] if char not in current]
+        current.extend(new)
+
+        return self.__ok({"new": new,
+                          "old": [char for char in payload["chars"] if char not in new],
+                          "is_new": is_new})
+
+    async def remove_to_spreadsheet(self, request: web.Request) -> web.Response:
+        sheet = request.match_info["sheet"]
+        payload = await self.__body(request)
+        sheets = self.sheets.get(payload["guild"], {})
+
+        if sheet not in sheets:
+            return self.__not_ok([], f"{sheet} not found")
+
+        chars = payload.get("chars", sheets[sheet])
+        deleted = [char for char in sheets[sheet] if char in chars]
+        left = [char for char in sheets[sheet] if char not in chars]
+
+        if len(left) == 0:
+            del sheets[sheet]
+        else:
+            sheets[sheet] = left
+
+        return self.__ok({"deleted": deleted,
+                          "left": left,
+                          "sheet_removed": len(left) == 0})
+
+    async def get_spreadsheet(self, request: web.Request) -> web.Response:
+        sheet, guild = request.match_info["sheet"], request.match_info["guild"]
+        chars = self.sheets.get(guild, {}).get(sheet)
+        found = {"sheet": sheet, "char_ids": chars} if chars is not None else {}
+
+        return self.__ok({"sheet": found})
+
+    async def guild_spreadsheets(self, request: web.Request) -> web.Response:
+        guild = request.match_info["guild"]
+        start = request.query.get("start", "")
+
+        return self.__ok({"sheets": [{"sheet": sheet, "char_ids": chars}
+                                     for sheet, chars in sorted(self.sheets.get(guild, {}).items())
+                                     if sheet.startswith(start)]})
+    # endregion
+
+    # region externally used
+    def add_server(self, srvr: str, guild: str, sheets: Dict[str, List[int]] = {}):
+        # Seeds the storage without going through the routes
+        self.srvr_guilds[str(srvr)] = str(guild)
+        self.sheets.setdefault(str(guild), {}).update(sheets)
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.__faults])
+
+        app.router.add_get(f"{SWGOH_PREFIX}characters", self.characters)
+        app.router.add_get(f"{SWGOH_PREFIX}guild/{{guild}}", self.guild)
+
+        app.router.add_put(f"{STORAGE_PREFIX}register", self.register)
+        app.router.add_get(f"{STORAGE_PREFIX}srvrs/{{srvr}}", self.srvrs)
+        app.router.add_put(f"{STORAGE_PREFIX}spreadsheet/{{sheet}}", self.add_to_spreadsheet)
+        app.router.add_delete(f"{STORAGE_PREFIX}spreadsheet/{{sheet}}", self.remove_to_spreadsheet)
+        app.router.add_get(f"{STORAGE_PREFIX}spreadsheet/{{sheet}}/{{guild}}", self.get_spreadsheet)
+        app.router.add_get(f"{STORAGE_PREFIX}spreadsheets/{{guild}}", self.guild_spreadsheets)
+
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> web.AppRunner:
+        runner = web.AppRunner(self.make_app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+
+        return runner
+    # endregion
+
+
+def add_fault_args(parser: argparse.ArgumentParser):
+    for group in ["swgoh", "storage"]:
+        parser.add_argument(f"--{group}-latency", type=float, default=0)
+        parser.add_argument(f"--{group}-jitter", type=float, default=0)
+        parser.add_argument(f"--{group}-error-rate", type=float, default=0)
+        parser.add_argument(f"--{group}-error-status", type=int, default=502)
+
+
+def faults_from_args(args: argparse.Namespace, group: str) -> Fault:
+    return Fault(latency=getattr(args, f"{group}_latency"),
+                 jitter=getattr(args, f"{group}_jitter"),
+                 error_rate=getattr(args, f"{group}_error_rate"),
+                 error_status=getattr(args, f"{group}_error_status"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in server for swgoh.gg and the MrLobot storage")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fixtures", help="Directory with recorded characters.json and guild_{id}.json")
+    parser.add_argument("--chars", type=int, default=250)
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--units", type=int, default=150)
+    parser.add_argument("--null-power", type=float, default=0, help="Share of units with null power")
+    parser.add_argument("--seed", type=int, default=0)
+    add_fault_args(parser)
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(swgoh_fault=faults_from_args(args, "swgoh"),
+                            storage_fault=faults_from_args(args, "storage"),
+                            fixtures=args.fixtures,
+                            chars=args.chars,
+                            players=args.players,
+                            units=args.units,
+                            null_power=args.null_power,
+                            seed=args.seed)
+
+    web.run_app(upstream.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
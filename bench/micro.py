@@ -0,0 +1,230 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+from typing import Callable, List, NamedTuple, Tuple
+
+from bench.payloads import make_characters, make_guild
+from bench.fake_server import FakeUpstream
+from bench.benchmark import configure
+
+# Micro benchmarks of the report path across guild and catalog sizes:
+#   python -m bench.micro --sizes 10x50,50x200,50x300 --chars 250,1000 --repeat 5
+
+
+class Timing(NamedTuple):
+    name: str
+    size: str
+    best: float
+    median: float
+
+
+def timed(name: str, size: str, fn: Callable, repeat: int) -> Timing:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    return Timing(name, size, min(times), statistics.median(times))
+
+
+async def timed_async(name: str, size: str, fn: Callable, repeat: int) -> Timing:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        times.append(time.perf_counter() - start)
+
+    return Timing(name, size, min(times), statistics.median(times))
+
+
+def parse_sizes(sizes: str) -> List[Tuple[int, int]]:
+    # "50x200" is 50 players with up to 200 units
+    return [tuple(int(part) for part in size.split("x")) for size in sizes.split(",")]
+
+
+def bump(payload: dict, share: float, seed: int = 0) -> dict:
+    # A later snapshot of the same guild, a share of the units got stronger
+    rnd = random.Random(seed)
+    payload = json.loads(json.dumps(payload))
+
+    for player in payload["players"]:
+        for unit in player["units"]:
+            if rnd.random() < share:
+                unit["data"]["power"] = (unit["data"]["power"] or 0) + rnd.randint(100, 2000)
+
+    return payload
+
+
+def churn(payload: dict, chars: List[dict]) -> dict:
+    # A later snapshot with a player gone, one joined, a unit removed, one
+    # unlocked and one stronger
+    payload = json.loads(json.dumps(payload))
+    players = payload["players"]
+
+    players.pop(0)
+    newcomer = json.loads(json.dumps(players[0]))
+    newcomer["data"].update(name="newcomer", ally_code=999999999)
+    players.append(newcomer)
+
+    players[1]["units"].pop()
+
+    owned = set(unit["data"]["base_id"] for unit in players[2]["units"])
+    missing = next(char["base_id"] for char in chars if char["base_id"] not in owned)
+    players[2]["units"].append({"data": {"base_id": missing, "power": 1234, "relic_tier": 1,
+                                         "gear_level": 1, "rarity": 1, "level": 1}})
+
+    bumped = players[3]["units"][0]["data"]
+    bumped["power"] = (bumped["power"] or 0) + 1000
+
+    return payload
+
+
+def check_reports(payload: dict, chars: List[dict], base_ids: List[str], unit_names: dict,
+                  stat_opts: List[str]):
+    # A report made from the cached state of an older roster matches a cold
+    # build, and the diff finds every scripted change
+    import pandas as pd
+
+    from providers.roster import parse_guild
+    from utils.reports import REPORT_MAPPER, build_state, diff_states, make_report
+
+    changed = churn(payload, chars)
+    old = parse_guild("1", json.dumps(payload).encode())
+    new = parse_guild("1", json.dumps(changed).encode())
+    new.fetched_at = old.fetched_at + 1
+
+    state = build_state(old)
+    updated, _ = make_report(state, new, base_ids, unit_names, stat_opts, "check", "csv")
+    cold = build_state(new)
+
+    for stat in REPORT_MAPPER:
+        pd.testing.assert_frame_equal(updated.sheets[stat], cold.sheets[stat])
+
+    diff = diff_states(state, cold)
+    players = changed["players"]
+    expected = {(players[2]["data"]["name"], players[2]["units"][-1]["data"]["base_id"]),
+                (players[3]["data"]["name"], players[3]["units"][0]["data"]["base_id"])}
+
+    assert diff.joined == ["newcomer"], diff.joined
+    assert diff.left == [payload["players"][0]["data"]["name"]], diff.left
+    assert set(zip(diff.changed["player"], diff.changed["base_id"])) == expected, diff.changed
+
+
+async def bench_get_chars(n_chars: int, repeat: int, port: int) -> Timing:
+    # Download, aliases, catalog and snapshot, as on the first start
+    upstream = FakeUpstream(chars=n_chars)
+    runner = await upstream.start(port=port)
+
+    from providers.swgoh import SWGOH
+
+    try:
+        async def get_chars():
+            swgoh = SWGOH()
+            await swgoh.get_chars()
+            await swgoh.client.close()
+
+        return await timed_async("get_chars", f"{n_chars} chars", get_chars, repeat)
+    finally:
+        await runner.cleanup()
+
+
+def bench_catalog(n_chars: int, repeat: int) -> List[Timing]:
+    from providers.aliases import AliasIndex
+    from providers.catalog import build_catalog
+
+    # Same shape SWGOH.__get_chars hands to __create_char_aliases
+    chars = [{"id": char["pk"], "name": char["name"].lower(), "base_id": char["base_id"]}
+             for char in make_characters(n_chars)]
+    size = f"{n_chars} chars"
+
+    id_chars = AliasIndex().update(chars)
+
+    return [timed("create_char_aliases", size, lambda: AliasIndex().update(chars), repeat),
+            timed("build_catalog", size, lambda: build_catalog(id_chars), repeat)]
+
+
+def bench_reports(players: int, units: int, n_chars: int, sheet_chars: int,
+                  null_power: float, repeat: int) -> List[Timing]:
+    from providers.aliases import AliasIndex
+    from providers.catalog import build_catalog
+    from providers.roster import parse_guild
+    from utils.reports import build_sheets, build_state, diff_states, make_report
+    from utils.render import render
+
+    chars = make_characters(n_chars)
+    catalog = build_catalog(AliasIndex().update([{"id": char["pk"],
+                                                  "name": char["name"].lower(),
+                                                  "base_id": char["base_id"]}
+                                                 for char in chars]))
+    base_ids = catalog.base_ids(sorted(catalog.id_names)[:sheet_chars])
+    unit_names = {base_id: catalog.base_id_names[base_id] for base_id in base_ids}
+    stat_opts = ["pg", "relic"]
+
+    payload = make_guild("1", chars, players=players, units=units, null_power=null_power)
+    raw = json.dumps(payload).encode()
+    raw_bumped = json.dumps(bump(payload, share=0.05)).encode()
+    size = f"{players}x{units} ({len(raw) // 1024} KB)"
+
+    roster = parse_guild("1", raw)
+    bumped = parse_guild("1", raw_bumped)
+    state = build_state(roster)
+    bumped_state = build_state(bumped)
+    sheets = build_sheets(state, base_ids, unit_names, stat_opts)
+
+    check_reports(payload, chars, base_ids, unit_names, stat_opts)
+
+    # make_spreadsheets is make_report run in the report executor
+    return [
+        timed("parse_guild", size, lambda: parse_guild("1", raw), repeat),
+        timed("make_spreadsheets cold", size,
+              lambda: make_report(None, roster, base_ids, unit_names, stat_opts, "bench", "csv"), repeat),
+        timed("make_spreadsheets cached", size,
+              lambda: make_report(state, roster, base_ids, unit_names, stat_opts, "bench", "csv"), repeat),
+        timed("make_spreadsheets new", size,
+              lambda: make_report(state, bumped, base_ids, unit_names, stat_opts, "bench", "csv"), repeat),
+        timed("diff_states 5%", size, lambda: diff_states(state, bumped_state), repeat),
+        timed("render csv", size, lambda: render("bench", sheets, "csv"), repeat),
+        timed("render xlsx", size, lambda: render("bench", sheets, "xlsx"), repeat),
+    ]
+
+
+async def run(args: argparse.Namespace) -> List[Timing]:
+    configure(f"http://127.0.0.1:{args.port}", tempfile.mkdtemp(prefix="mrlobot_micro_"), False)
+    timings = []
+
+    for n_chars in [int(n) for n in args.chars.split(",")]:
+        timings.append(await bench_get_chars(n_chars, args.repeat, args.port))
+        timings.extend(bench_catalog(n_chars, args.repeat))
+
+    for players, units in parse_sizes(args.sizes):
+        timings.extend(bench_reports(players, units, int(args.chars.split(",")[0]),
+                                     args.sheet_chars, args.null_power, args.repeat))
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro benchmarks of the report path")
+    parser.add_argument("--sizes", default="10x50,50x200,50x300", help="players x units per player")
+    parser.add_argument("--chars", default="250,1000", help="Catalog sizes")
+    parser.add_argument("--sheet-chars", type=int, default=30)
+    parser.add_argument("--null-power", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    timings = asyncio.get_event_loop().run_until_complete(run(args))
+
+    print(f"{'benchmark':<28} {'size':<22} {'best ms':>9} {'median ms':>10}")
+    for timing in timings:
+        print(f"{timing.name:<28} {timing.size:<22} {timing.best * 1000:>9.1f} {timing.median * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
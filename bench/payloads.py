@@ -0,0 +1,131 @@
+import sys
+import json
+import random
+import argparse
+
+from typing import List, Optional, Sequence
+
+# Synthetic swgoh.gg payloads, shaped as the parts the providers read:
+#   python -m bench.payloads guild --players 50 --units 200 --null-power 0.05 > guild.json
+
+NAME_PARTS = ["darth", "jedi", "master", "commander", "general", "captain", "clone",
+              "trooper", "sith", "rey", "kylo", "luke", "han", "chewbacca", "padme",
+              "ahsoka", "grievous", "mace", "windu", "boba", "fett", "bastila", "shan"]
+
+# Weights of relic 0 to 9 among the units at gear 13, higher relics are rarer
+RELIC_WEIGHTS = [12, 10, 9, 8, 7, 6, 5, 4, 2, 1]
+# Share of the units at gear 13, only those have relics
+G13_SHARE = 0.4
+MAX_LEVEL = 85
+
+
+def make_characters(n: int = 250, seed: int = 0) -> List[dict]:
+    # [{pk, name, base_id}] as served by /characters
+    rnd = random.Random(seed)
+    chars = []
+    names = set()
+
+    for pk in range(1, n + 1):
+        name = " ".join(rnd.sample(NAME_PARTS, rnd.randint(1, 3)))
+        # Names are unique in the real catalog
+        while name in names:
+            name = f"{name} {pk}"
+        names.add(name)
+
+        chars.append({"pk": pk,
+                      "name": name.title(),
+                      "base_id": name.upper().replace(" ", "")})
+
+    return chars
+
+
+def make_unit(rnd: random.Random, base_id: str, relic_weights: Sequence[float],
+              g13_share: float, null_power: float) -> dict:
+    if rnd.random() < g13_share:
+        gear_level, rarity, level = 13, 7, MAX_LEVEL
+        relic = rnd.choices(range(len(relic_weights)), weights=relic_weights)[0]
+        # swgoh.gg relic_tier: 1 locked, 2 relic 0, 3 relic 1...
+        relic_tier = relic + 2
+        power = 20000 + relic * 2500 + rnd.randint(0, 2000)
+    else:
+        gear_level = rnd.randint(1, 12)
+        rarity = rnd.randint(1, 7)
+        level = rnd.randint(1, MAX_LEVEL)
+        relic_tier = 1
+        power = gear_level * 1200 + rarity * 300 + level * 20 + rnd.randint(0, 500)
+
+    return {"data": {"base_id": base_id,
+                     # swgoh.gg sends null power for some units
+                     "power": None if rnd.random() < null_power else power,
+                     "relic_tier": relic_tier,
+                     "gear_level": gear_level,
+                     "rarity": rarity,
+                     "level": level}}
+
+
+def make_guild(guild: str,
+               chars: List[dict],
+               players: int = 50,
+               units: int = 150,
+               seed: int = 0,
+               relic_weights: Sequence[float] = RELIC_WEIGHTS,
+               g13_share: float = G13_SHARE,
+               null_power: float = 0) -> dict:
+    # {data, players: [{data, units: [{data}]}]} as served by /guild/{id}
+    rnd = random.Random(f"{seed}-{guild}")
+    roster = []
+
+    for ix in range(players):
+        # Rosters are not all the same size, up to units each
+        owned = rnd.sample(chars, min(rnd.randint(units * 3 // 4, units), len(chars)))
+        roster.append({
+            "data": {"name": f"player {ix}",
+                     "ally_code": 100000000 + ix,
+                     "galactic_power": 0},
+            "units": [make_unit(rnd, char["base_id"], relic_weights, g13_share, null_power)
+                      for char in owned]
+        })
+
+    for player in roster:
+        player["data"]["galactic_power"] = sum(unit["data"]["power"] or 0
+                                               for unit in player["units"])
+
+    return {"data": {"id": guild,
+                     "name": f"guild {guild}",
+                     "member_count": players,
+                     "galactic_power": sum(player["data"]["galactic_power"] for player in roster)},
+            "players": roster}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Synthetic swgoh.gg payloads")
+    parser.add_argument("kind", choices=["characters", "guild"])
+    parser.add_argument("--guild", default="1")
+    parser.add_argument("--chars", type=int, default=250)
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--units", type=int, default=150)
+    parser.add_argument("--relic-weights", default=",".join(map(str, RELIC_WEIGHTS)),
+                        help="Comma separated weights of relic 0 to N")
+    parser.add_argument("--g13-share", type=float, default=G13_SHARE)
+    parser.add_argument("--null-power", type=float, default=0, help="Share of units with null power")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    chars = make_characters(args.chars, args.seed)
+
+    if args.kind == "characters":
+        payload = chars
+    else:
+        payload = make_guild(args.guild, chars,
+                             players=args.players,
+                             units=args.units,
+                             seed=args.seed,
+                             relic_weights=[float(weight) for weight in args.relic_weights.split(",")],
+                             g13_share=args.g13_share,
+                             null_power=args.null_power)
+
+    json.dump(payload, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
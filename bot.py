@@ -7,6 +7,10 @@ from discord.ext.commands import CommandNotFound
 from pathlib import Path
 from dotenv import load_dotenv
 
+# Before any module of the bot is imported, they read their settings
+# (LOG_DIR, LOG_MAX_BYTES...) from the environment when imported
+load_dotenv()
+
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -18,10 +22,12 @@ COGS = [*Path("cogs").glob("*.py")]
 class Bot(B):
 
     def __init__(self):
-        load_dotenv()
         self.ready = False
         self.TOKEN = os.getenv('DISCORD_TOKEN')
-        super().__init__(command_prefix=PREFIX)
+        # Discord user ids allowed to run the bot wide admin commands,
+        # the owner of the application when empty
+        owner_ids = set(int(id) for id in os.getenv("MRLOBOT_ADMINS", "").split(",") if id.strip())
+        super().__init__(command_prefix=PREFIX, owner_ids=owner_ids)
 
     def setup(self):
         for cog in COGS:
@@ -1,21 +1,31 @@
-import pydash
+import io
 import os
-
-import pandas as pd
+import time
 
 from logging import exception
 from discord import Embed, File
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ext.commands import Cog
 from discord.ext.commands import command
 from discord.ext.commands.errors import CommandInvokeError
 
 from providers.swgoh import SWGOH
 from providers.endpoints import MrLobotStorageEndpoint
+from providers.catalog import diff_catalogs
+from providers.srvr_cache import ServerGuildCache
+from providers.roster import Roster
+from providers.cache import TTLCache
+from utils.reports import diff_states, make_report
+from utils.render import RenderedFile
+from utils.executor import ReportExecutor
+from utils.scheduler import FairScheduler
+from utils.profiler import CommandProfiler, ProfileSession, profile_call
+from utils.metrics import COMMAND_SECONDS, PROVIDER_SECONDS, REGISTRY, STAGE_SECONDS, \
+    UPSTREAM_BYTES, UPSTREAM_SECONDS, Histogram, start_server
 
 # from operator import itemgetter
 # from nltk import ngrams
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 
 from utils.logger import get_logger
 from utils.exc import EndpointException
@@ -24,32 +34,155 @@ from pdb import set_trace as bp
 
 logger = get_logger(__name__)
 
+# Typos resolved with a lower score are reported as not found
+FUZZY_MIN_SCORE = float(os.getenv("FUZZY_MIN_SCORE", 0.7))
+
+# Minutes between catalog refreshes from swgoh.gg
+CATALOG_REFRESH_MINUTES = float(os.getenv("CATALOG_REFRESH_MINUTES", 60))
+
+# Per guild report state, kept to only recompute roster changes
+REPORT_STATE_TTL = float(os.getenv("REPORT_STATE_TTL", 24 * 60 * 60))
+REPORT_STATE_BYTES = int(os.getenv("REPORT_STATE_BYTES", 128 * 1024 * 1024))
+
+# Rendered reports, keyed by the roster version they were made from
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", 60 * 60))
+REPORT_CACHE_BYTES = int(os.getenv("REPORT_CACHE_BYTES", 16 * 1024 * 1024))
+# Off by default. Reports use a recently expired roster when swgoh.gg is slow
+# (see SWGOH_GUILD_STALE_BUDGET), "refresh" always waits for a fresh one
+REPORT_STALE_OK = os.getenv("REPORT_STALE_OK", "0") == "1"
+
 
 class MrSpreadsheet(Cog):
     def __init__(self, bot) -> None:
         self.bot = bot
         # self.db = MrLobotDB()
-        # self.chars = pd.DataFrame()
-        self.alias_char = {}
-        self.srvr_guilds = {}
+        self.chars = None
+        self.srvr_cache = ServerGuildCache()
+        self.warmed_up = False
+        self.report_states = TTLCache(ttl=REPORT_STATE_TTL,
+                                      max_bytes=REPORT_STATE_BYTES)
+        self.report_cache = TTLCache(ttl=REPORT_CACHE_TTL,
+                                     max_bytes=REPORT_CACHE_BYTES)
+        self.executor = ReportExecutor()
+        self.scheduler = FairScheduler()
 
         self.swgoh = SWGOH()
         self.mrlobot_storage = MrLobotStorageEndpoint()
 
+        self.profiler = CommandProfiler()
+        self.metrics_server = None
+        REGISTRY.register_cache("guilds", self.swgoh.guild_cache)
+        REGISTRY.register_cache("report_states", self.report_states)
+        REGISTRY.register_cache("reports", self.report_cache)
+        REGISTRY.register_gauge("mrlobot_reports_queued", "Reports waiting for a worker",
+                                lambda: self.scheduler.queued)
+        REGISTRY.register_gauge("mrlobot_reports_running", "Reports being made",
+                                lambda: self.scheduler.running)
+
     @Cog.listener()
     async def on_ready(self):
-        self.chars, self.alias_char = self.swgoh.get_chars()
-        logger.info("Chars built")
+        # on_ready fires again on every reconnect, the catalog is kept
+        if self.chars is None:
+            # The snapshot lets the bot answer before swgoh.gg does
+            self.chars = self.swgoh.load_chars()
+
+        if self.chars is None:
+            self.chars = await self.swgoh.get_chars()
+            logger.info("Chars built")
+
+        if not self.catalog_refresher.is_running():
+            self.catalog_refresher.start()
+
+        if not self.warmed_up:
+            self.warmed_up = True
+            self.bot.loop.create_task(self.warmup_guilds())
+
+        if self.metrics_server is None:
+            try:
+                self.metrics_server = await start_server()
+            except Exception as ex:
+                # The bot works without it, e.g. the port is taken
+                logger.error(f"Metrics server not started: {ex}")
 
         # action = ["abilities", "list"]
         # result = self.client.action(self.schema, action)
 
         print("MrLobot spreadsheets ready")
 
+    @tasks.loop(minutes=CATALOG_REFRESH_MINUTES)
+    async def catalog_refresher(self):
+        try:
+            # Skipped while the catalog is fresh, e.g. just downloaded
+            if self.swgoh.catalog_age < CATALOG_REFRESH_MINUTES * 60 / 2:
+                return
+
+            chars = await self.swgoh.get_chars()
+
+            if chars is not self.chars:
+                diff = diff_catalogs(self.chars, chars)
+                # Swapped at once, commands see either catalog never a mix
+                self.chars = chars
+
+                logger.info(f"Chars refreshed: {len(diff['added'])} added, "
+                            f"{len(diff['removed'])} removed, {len(diff['renamed'])} renamed")
+                for name in diff["added"]:
+                    logger.info(f"Unit added: {name}")
+                for old, new in diff["renamed"]:
+                    logger.info(f"Unit renamed: {old} -> {new}")
+        except Exception as ex:
+            # The loaded catalog keeps being served
+            logger.error(ex)
+
+    async def warmup_guilds(self):
+        try:
+            # Only the servers without a fresh mapping are looked up
+            srvrs = [str(srvr.id) for srvr in self.bot.guilds
+                     if not self.srvr_cache.get(srvr.id)[0]]
+
+            if len(srvrs) == 0:
+                return
+
+            logger.info(f"Warming up the guilds of {len(srvrs)} servers")
+            srvr_guilds = await self.mrlobot_storage.guild_servers_batch(srvrs)
+
+            self.srvr_cache.put_many(srvr_guilds)
+            logger.info(f"Guilds warmed up for {len(srvr_guilds)} servers")
+        except Exception as ex:
+            logger.error(ex)
+
+    def cog_unload(self):
+        self.catalog_refresher.cancel()
+        self.srvr_cache.close()
+        self.scheduler.close()
+        self.executor.shutdown()
+
+        # Both providers share the pooled session
+        self.bot.loop.create_task(self.swgoh.client.close())
+
+        if self.metrics_server is not None:
+            self.bot.loop.create_task(self.metrics_server.cleanup())
+
+    async def cog_before_invoke(self, ctx):
+        ctx.started_at = time.perf_counter()
+
+        # Only a dict check unless an admin turned profiling on
+        if self.profiler.armed:
+            ctx.profile = self.profiler.start(ctx.command.name)
+
+    async def cog_after_invoke(self, ctx):
+        # Called for failed commands as well
+        COMMAND_SECONDS.observe(time.perf_counter() - ctx.started_at,
+                                command=ctx.command.name,
+                                status="error" if ctx.command_failed else "ok")
+
+        session = getattr(ctx, "profile", None)
+        if session is not None:
+            await self.__save_profile(session)
+
     # region auxiliar methods
-    def __check_guild(self, _, id_guild):
+    async def __check_guild(self, _, id_guild):
         try:
-            res = self.swgoh.guild_info(id_guild)
+            res = await self.swgoh.guild_info(id_guild)
             return {"ok": 1,
                     "response": res,
                     "message": res["name"]}
@@ -59,35 +192,83 @@ class MrSpreadsheet(Cog):
             logger.error(ex)
             raise ex
 
-    def __check_chars(self, chars: List[int]):
+    def __check_chars(self, chars: List[int], use_guesses: bool = True):
+        # Without use_guesses the typos are still guessed but left unknown
         try:
             correct = {}
             unk = set()
+            guessed = {}
 
             for char in chars:
-                try:
-                    char_info = self.alias_char[char.strip()]
-                    correct[char_info["id"]] = {
-                        "id": char_info["id"],
-                        "name": char_info["name"]
+                id = self.chars.resolve(char.strip())
+
+                if id is None:
+                    guess = self.chars.guess(char, FUZZY_MIN_SCORE)
+
+                    if guess is not None and guess[1] >= FUZZY_MIN_SCORE:
+                        guessed[char.strip()] = (self.chars.id_names[guess[0]], guess[1])
+                        if use_guesses:
+                            id = guess[0]
+
+                if id is not None:
+                    correct[id] = {
+                        "id": id,
+                        "name": self.chars.id_names[id]
                     }
-                except:
+                else:
                     unk.add(char)
 
-            return correct, unk
+            return correct, unk, guessed
         except Exception as ex:
             logger.error(ex)
             raise
 
-    def get_guild(self, srvr: str):
+    async def __register_guild(self, srvr: str, guild: str):
+        response = await self.mrlobot_storage.register_guild(srvr, guild)
+
+        # Written through, the new guild is used from the next command
+        self.srvr_cache.put(srvr, guild)
+
+        return response
+
+    def __guessed_chars_embed(self, guessed: dict,
+                              title: str = "**Mr.Lobot** guessed the following chars") -> Embed:
+        embed = Embed(
+            title=title,
+            color=0xffff00)
+
+        embed.add_field(name="PRY char name",
+                        value="\n".join([f"> {char} → {name} ({score:.0%})"
+                                         for char, (name, score) in guessed.items()]))
+
+        return embed
+
+    def __char_pages(self, names: List[str], page_size: int = 10) -> Iterator[Embed]:
+        embed = Embed(title=f"Chars")
+
+        for ix, name in enumerate(names, start=1):
+            embed.add_field(name="name",
+                            value=name,
+                            inline=False)
+            embed.add_field(name="alias",
+                            value="\n".join([f"> {x}" for x in self.chars.name_aliases[name]]))
+
+            if ix % page_size == 0:
+                yield embed
+                embed = Embed(title=f"Chars")
+
+        if len(names) % page_size != 0:
+            yield embed
+
+    async def get_guild(self, srvr: str):
         try:
-            guild = self.srvr_guilds.get(str(srvr))
+            hit, guild = self.srvr_cache.get(srvr)
 
-            if not guild:
+            if not hit:
                 logger.warn(f"This stuff is expensive: scanning for {srvr}")
 
                 try:
-                    response = self.mrlobot_storage\
+                    response = await self.mrlobot_storage\
                         .guild_servers(srvr)
                 except Exception as ex:
                     # Endpoint error, we don't need custom messaga
@@ -95,86 +276,127 @@ class MrSpreadsheet(Cog):
 
                 temp = response["content"]
 
-                if len(temp) == 0 or temp is None:
-                    raise Exception((f"**Mr.Lobot** did not find any guild in this server.\n"
-                                     f"Use **+mrlobot_config guild \\guild_id\\ ** to add it."))
+                if temp is None or len(temp) == 0:
+                    # Servers without guild are not scanned again for a while
+                    self.srvr_cache.put_missing(srvr)
                 else:
-                    self.srvr_guilds\
-                        .update({item["srvr"]: item["guild"] for item in temp})
-
-                # self.srvr_guilds = {'628798768355082260': '69571'}
+                    srvr_guilds = {item["srvr"]: item["guild"] for item in temp}
+                    self.srvr_cache.put_many(srvr_guilds)
+                    guild = srvr_guilds.get(str(srvr))
 
-            guild = self.srvr_guilds.get(str(srvr))
+            if guild is None:
+                raise Exception((f"**Mr.Lobot** did not find any guild in this server.\n"
+                                 f"Use **+mrlobot_config guild \\guild_id\\ ** to add it."))
 
             return guild
         except Exception as ex:
             logger.error(ex)
             raise ex
 
-    def make_spreadsheets(self, guild: str, char_ids: List[int], stat_opts: List[str]) -> List[pd.DataFrame]:
-        def relic(unit_data: dict) -> int:
-            r_level = int(unit_data["relic_tier"]) - 2
-
-            return r_level*(r_level > 0)
-
-        def def_processor(sheet: pd.DataFrame) -> pd.DataFrame:
-            sheet = sheet.fillna(0)
-            data_cols = sheet.columns[1:]
-            temp = sheet[data_cols].astype("int32")
-            sheet[data_cols] = temp
-
-            return sheet
+    async def __save_profile(self, session: ProfileSession):
+        try:
+            elapsed = time.perf_counter() - session.started_at
+            paths = self.profiler.stop(session)
+            channel = session.request.channel
 
-        REPORT_MAPPER = {
-            "pg": lambda x: x["power"] or 0,
-            "relic": relic,
-        }
+            if channel is not None:
+                await channel.send(f"Profile of **+{session.request.command}** ({elapsed:.2f}s)",
+                                   files=[File(str(path), filename=path.name) for path in paths])
+        except Exception as ex:
+            # Profiling never fails the command
+            logger.error(ex)
 
-        SHEET_PROCESSOR = {
-            "pg": def_processor,
-            "relic": def_processor,
-        }
+    def __histogram_lines(self, histogram: Histogram, max_lines: int = 10) -> str:
+        def ms(bound):
+            return f"{bound * 1000:.0f} ms" if bound != float("inf") else "+Inf"
+
+        lines = []
+        for key in sorted(histogram.counts):
+            name = " ".join(value for _, value in key)
+            lines.append(f"> {name}: {histogram.count(key)}, "
+                         f"p50 ≤ {ms(histogram.quantile(key, 0.5))}, "
+                         f"p99 ≤ {ms(histogram.quantile(key, 0.99))}")
+
+        if len(lines) > max_lines:
+            lines = [*lines[:max_lines], f"> ... and {len(lines) - max_lines} more"]
+
+        return "\n".join(lines) if len(lines) > 0 else "> Nothing yet"
+
+    def __format_age(self, seconds: float) -> str:
+        if seconds < 60:
+            return "just now"
+        elif seconds < 60 * 60:
+            return f"{int(seconds // 60)} min ago"
+        else:
+            return f"{seconds / (60 * 60):.1f} h ago"
+
+    async def make_spreadsheets(self, guild: str, roster: Roster, sheet_name: str, char_ids: List[int],
+                                stat_opts: List[str], fmt: str = "csv",
+                                profile: Optional[ProfileSession] = None) -> List[RenderedFile]:
+        # (state, state of the roster before it) per guild, +mrlobot_changes
+        # diffs them
+        cached = self.report_states.get(str(guild))
+        current, previous = cached if cached is not None else (None, None)
+
+        base_ids = self.chars.base_ids(char_ids)
+        unit_names = {base_id: self.chars.base_id_names[base_id] for base_id in base_ids}
+
+        args = (current, roster, base_ids, unit_names, stat_opts, sheet_name, fmt)
+
+        # Flatten, pivot and render run off the event loop
+        with STAGE_SECONDS.time(stage="compute"):
+            if profile is None:
+                state, rendered = await self.executor.run(make_report, *args)
+            else:
+                # The worker is profiled on its own thread, the loop profiler misses it
+                (state, rendered), worker = await self.executor.run(profile_call,
+                                                                    self.profiler.sampling,
+                                                                    make_report,
+                                                                    *args)
+                profile.workers.append(worker)
 
-        players_stats = self.swgoh.get_guild_players(guild)
-        base_ids = self.chars[self.chars["id"]
-                              .isin(char_ids)]["base_id"].unique().tolist()
+        if current is not None and current.version != state.version:
+            previous = current
 
-        mrlobot_sheets = []
-        unit_names = {x["base_id"]: x["name"]
-                      for x in self.alias_char.values()}
-        unit_names["PLAYER"] = "PLAYER"
+        nbytes = state.nbytes + (previous.nbytes if previous is not None else 0)
+        self.report_states.put(str(guild), (state, previous), nbytes)
 
-        for stat in stat_opts:
-            player_stats = []
+        return rendered
 
-            for pstats in players_stats:
+    async def report_spreadsheets(self, guild: str, sheet_name: str, char_ids: List[int],
+                                  stat_opts: List[str], fmt: str = "csv",
+                                  refresh: bool = False,
+                                  profile: Optional[ProfileSession] = None) -> Tuple[Roster, List[RenderedFile]]:
+        roster = await self.swgoh.get_guild_players(guild, refresh, stale_ok=REPORT_STALE_OK)
 
-                name = pstats["data"].get("name")
-                unit_stats = pydash.chain(pstats["units"])\
-                    .map(lambda x: x["data"])\
-                    .filter(lambda x: x["base_id"] in base_ids)\
-                    .map(lambda x: (x["base_id"], REPORT_MAPPER.get(stat, "")(x)))\
-                    .value()
+        # A new roster means a new version, older entries are just evicted
+        key = (str(guild), sheet_name, tuple(stat_opts), fmt,
+               tuple(sorted(set(char_ids))), roster.fetched_at)
 
-                unit_stats = dict(unit_stats)
-                unit_stats["PLAYER"] = name
+        rendered = self.report_cache.get(key)
 
-                player_stats.append(unit_stats)
+        if rendered is None:
+            rendered = await self.make_spreadsheets(guild=guild,
+                                                    roster=roster,
+                                                    sheet_name=sheet_name,
+                                                    char_ids=char_ids,
+                                                    stat_opts=stat_opts,
+                                                    fmt=fmt,
+                                                    profile=profile)
 
-            temp = pd.DataFrame(player_stats, columns=["PLAYER", *base_ids])
-            temp.columns = temp.columns.to_series().map(unit_names)
-            mrlobot_sheets.append(
-                (stat, SHEET_PROCESSOR[stat](temp))
-            )
+            self.report_cache.put(key, rendered,
+                                  sum(len(file.content) for file in rendered))
+        else:
+            logger.info(f"Report {key} served from cache")
 
-        return mrlobot_sheets
+        return roster, rendered
 
     # endregion
 
     # region commands
 
     CONFIG_OPTIONS_MAPPER = {
-        "guild": lambda self, ctx, x: self.mrlobot_storage.register_guild(*x)
+        "guild": lambda self, ctx, x: self.__register_guild(*x)
     }
 
     CONFIG_PRES = {
@@ -189,13 +411,13 @@ class MrSpreadsheet(Cog):
         try:
             sent = (ctx.guild.id, value)
 
-            requirements = self.CONFIG_PRES\
+            requirements = await self.CONFIG_PRES\
                 .get(option,
                      lambda _, x: exc_wrapper(option)
                      )(self, sent)
 
             if requirements["ok"]:
-                response = self.CONFIG_OPTIONS_MAPPER\
+                response = await self.CONFIG_OPTIONS_MAPPER\
                     .get(option,
                          lambda _, x: exc_wrapper(option)
                          )(self, ctx, sent)
@@ -223,38 +445,11 @@ class MrSpreadsheet(Cog):
     @command(name="mrlobot_listchars", aliases=["list", "l"])
     async def mrlobot_listchars(self, ctx, start: Optional[str]):
         try:
-            chars_to_list = self.chars
-            if start:
-                ixs = self.chars.apply(
-                    lambda x: x["name"].startswith(start), axis=1)
-                chars_to_list = self.chars[ixs]
+            names = self.chars.starting_with(start)
 
-            grouped_chars = chars_to_list.groupby("name").indices
-
-            if len(grouped_chars) > 0:
-                await ctx.send("This is gonna take looong")
-
-                embed = Embed(title=f"Chars")
-                need_send = False
-
-                for ix, (name, row_ixs) in enumerate(grouped_chars.items()):
-                    ix += 1
-                    aliases = chars_to_list.iloc[row_ixs]\
-                        .apply(lambda x: x["alias"], axis=1).tolist()
-
-                    embed.add_field(name="name",
-                                    value=name,
-                                    inline=False)
-                    embed.add_field(name="alias",
-                                    value="\n".join([f"> {x}" for x in aliases]))
-                    need_send = True
-
-                    if ix % 10 == 0:
-                        await ctx.send(embed=embed)
-                        embed = Embed(title=f"Chars")
-                        need_send = False
-
-                if need_send:
+            if len(names) > 0:
+                # Each page is sent as soon as it is filled
+                for embed in self.__char_pages(names):
                     await ctx.send(embed=embed)
             else:
                 await ctx.send((f"**Mr.Lobot** did not found any units starting with **{start}**"))
@@ -280,11 +475,11 @@ class MrSpreadsheet(Cog):
     async def mrlobot_addsheet(self, ctx, sheet_name: str, *, chars: str):
         try:
             srvr_id = str(ctx.guild.id)
-            guild = self.get_guild(srvr_id)
+            guild = await self.get_guild(srvr_id)
 
             chars = chars.split(",")
 
-            correct_chars, error_chars = self.__check_chars(chars)
+            correct_chars, error_chars, guessed_chars = self.__check_chars(chars)
 
             error_chars_embed = Embed(
                 title=f"**Mr.Lobot** didn't find the following chars",
@@ -295,9 +490,12 @@ class MrSpreadsheet(Cog):
                                             value="\n".join(map(lambda x: f"> {x}", error_chars)))
                 await ctx.send(embed=error_chars_embed)
 
+            if len(guessed_chars) > 0:
+                await ctx.send(embed=self.__guessed_chars_embed(guessed_chars))
+
             if len(correct_chars) > 0:
                 try:
-                    response = self.mrlobot_storage\
+                    response = await self.mrlobot_storage\
                         .add_to_spreadsheet(sheet=sheet_name,
                                             guild=guild,
                                             chars=[*correct_chars.keys()])
@@ -316,14 +514,12 @@ class MrSpreadsheet(Cog):
                     color=0x00ff00)
 
                 if len(added) > 0:
-                    names = self.chars[self.chars["id"]
-                                       .isin(added)]["name"].unique()
+                    names = self.chars.names(added)
                     correct_chars_embed.add_field(name="Chars added",
                                                   value="\n".join(map(lambda x: f'> {x}', names)))
 
                 if len(repeated) > 0:
-                    names = self.chars[self.chars["id"]
-                                       .isin(repeated)]["name"].unique()
+                    names = self.chars.names(repeated)
                     correct_chars_embed.add_field(name="Chars already stored",
                                                   value="\n".join(map(lambda x: f'> {x}', names)))
 
@@ -351,12 +547,13 @@ class MrSpreadsheet(Cog):
     async def mrlobot_deletesheet(self, ctx, sheet_name: str, *, chars: Optional[str] = ""):
         try:
             srvr_id = str(ctx.guild.id)
-            guild = self.get_guild(srvr_id)
+            guild = await self.get_guild(srvr_id)
 
             if len(chars) != 0:
                 chars = chars.split(",")
 
-            correct_chars, error_chars = self.__check_chars(chars)
+            # A guessed typo could delete another unit, only exact names count
+            correct_chars, error_chars, guessed_chars = self.__check_chars(chars, use_guesses=False)
 
             error_chars_embed = Embed(
                 title=f"**Mr.Lobot** didn't find the following chars",
@@ -370,6 +567,10 @@ class MrSpreadsheet(Cog):
                                             value="\n".join(map(lambda x: f"> {x}", error_chars)))
                 await ctx.send(embed=error_chars_embed)
 
+            if len(guessed_chars) > 0:
+                title = f"**Mr.Lobot** only deletes exact names, did you mean?"
+                await ctx.send(embed=self.__guessed_chars_embed(guessed_chars, title))
+
             try:
                 send_chars = [*correct_chars.keys()]
                 # We send a dummy if chars are define
@@ -378,7 +579,7 @@ class MrSpreadsheet(Cog):
                     if len(chars) > 0 \
                     else send_chars
 
-                response = self.mrlobot_storage\
+                response = await self.mrlobot_storage\
                     .remove_to_spreadsheet(sheet=sheet_name,
                                            guild=guild,
                                            chars=send_chars)
@@ -396,14 +597,12 @@ class MrSpreadsheet(Cog):
             elif len(correct_chars) > 0:
 
                 if len(deleted) > 0:
-                    names = self.chars[self.chars["id"]
-                                       .isin(deleted)]["name"].unique()
+                    names = self.chars.names(deleted)
                     correct_chars_embed.add_field(name="Chars removed",
                                                   value="\n".join(map(lambda x: f'> {x}', names)))
 
                 if len(left) > 0:
-                    names = self.chars[self.chars["id"]
-                                       .isin(left)]["name"].unique()
+                    names = self.chars.names(left)
                     correct_chars_embed.add_field(name="Chars left in the spreadsheet",
                                                   value="\n".join(map(lambda x: f'> {x}', names)))
 
@@ -432,12 +631,12 @@ class MrSpreadsheet(Cog):
     async def mrlobot_showsheet(self, ctx, start: str):
         try:
             srvr_id = str(ctx.guild.id)
-            guild = self.get_guild(srvr_id)
+            guild = await self.get_guild(srvr_id)
 
             try:
                 if start == "*":
                     start = ""
-                response = self.mrlobot_storage\
+                response = await self.mrlobot_storage\
                     .guild_spreadsheets(guild=guild,
                                         start_expression=start)
             except Exception as ex:
@@ -457,8 +656,7 @@ class MrSpreadsheet(Cog):
                         title=f"Sheet: {sheet['sheet']}")
 
                     chars = [int(ch) for ch in sheet["char_ids"]]
-                    char_names = self.chars[self.chars["id"].isin(
-                        chars)]["name"].unique()
+                    char_names = self.chars.names(chars)
 
                     embed.add_field(name="Chars",
                                     value="\n".join(map(lambda x: f'> {x}', char_names)))
@@ -486,11 +684,63 @@ class MrSpreadsheet(Cog):
         "relic": "Unit relic level"
     }
 
+    REFRESH_OPTION = "refresh"
+
+    VALID_FORMATS = {
+        "csv": "A csv file per stat",
+        "xlsx": "A single xlsx file with a sheet per stat",
+        "zip": "A single zip with a csv file per stat"
+    }
+
+    async def __run_report(self, ctx, guild, sheet_name, stat_opts, fmt, refresh):
+        # Runs in a scheduler worker, once the rate limits let it start
+        try:
+            response = await self.mrlobot_storage\
+                .get_spreadsheet(guild, sheet_name)
+
+            sheet = response["sheet"]
+
+            if "char_ids" in sheet:
+                chars = list(map(lambda x: int(x), sheet["char_ids"]))
+
+                roster, mrlobot_sheets_info = await self.report_spreadsheets(guild=guild,
+                                                                             sheet_name=sheet_name,
+                                                                             char_ids=chars,
+                                                                             stat_opts=stat_opts,
+                                                                             fmt=fmt,
+                                                                             refresh=refresh,
+                                                                             profile=getattr(ctx, "profile", None))
+                age = self.__format_age(roster.age)
+
+                with STAGE_SECONDS.time(stage="upload"):
+                    for file in mrlobot_sheets_info:
+                        stats = ", ".join([self.VALID_SPREADSHEETS[attr] for attr in file.stats])
+
+                        # Uploaded straight from memory, nothing touches the disk
+                        await ctx.send(f"Spreadsheet {sheet_name} for {stats} (guild data fetched {age})",
+                                       file=File(io.BytesIO(file.content), filename=file.filename))
+
+            else:
+                await ctx.send((f"**Mr.Lobot** did not locate the spreadsheet **{sheet_name}** "
+                                f"on his database."))
+        except Exception as ex:
+            logger.error(ex)
+            raise
+
     @command(name="mrlobot_reportsheet", aliases=["report", "r"])
     async def mrlobot_reportsheet(self, ctx, sheet_name: str, *, to_report: str):
         try:
             opts = [*map(lambda x: x.strip(), to_report.split(","))]
 
+            # Skips the cached guild data
+            refresh = self.REFRESH_OPTION in opts
+            opts = [opt for opt in opts if opt != self.REFRESH_OPTION]
+
+            # csv files unless a bundled format is asked
+            fmts = [opt for opt in opts if opt in self.VALID_FORMATS]
+            fmt = fmts[-1] if len(fmts) > 0 else "csv"
+            opts = [opt for opt in opts if opt not in self.VALID_FORMATS]
+
             opts_to_report = {True: [],
                               False: []}
 
@@ -509,40 +759,42 @@ class MrSpreadsheet(Cog):
                                     value=f"**{val}**",
                                     inline=False)
 
+                embed.add_field(name="Formats",
+                                value="\n".join([f"> {item}: {val}"
+                                                 for item, val in self.VALID_FORMATS.items()]),
+                                inline=False)
+
                 await ctx.send(embed=embed)
 
             if len(opts_to_report[True]) > 0:
-                guild = self.get_guild(ctx.guild.id)
-                try:
-                    response = self.mrlobot_storage\
-                        .get_spreadsheet(guild, sheet_name)
-                except Exception as ex:
-                    # Endpoint error, we don't need custom messaga
-                    raise ex
-
-                sheet = response["sheet"]
-
-                if "char_ids" in sheet:
-                    chars = list(map(lambda x: int(x), sheet["char_ids"]))
-
+                guild = await self.get_guild(ctx.guild.id)
+                stat_opts = opts_to_report[True]
+
+                # The same report asked twice in a channel runs once
+                key = (ctx.channel.id, str(guild), sheet_name, tuple(stat_opts), fmt, refresh)
+                job, is_new = self.scheduler.submit(ctx.guild.id, guild, key,
+                                                    lambda: self.__run_report(ctx=ctx,
+                                                                              guild=guild,
+                                                                              sheet_name=sheet_name,
+                                                                              stat_opts=stat_opts,
+                                                                              fmt=fmt,
+                                                                              refresh=refresh),
+                                                    upstream=lambda: refresh or not self.swgoh.has_guild(guild))
+                wait = self.scheduler.guild_wait(job)
+
+                if not is_new:
+                    await ctx.send((f"**Mr.Lobot** is already working on this report"))
+                elif wait > 0:
+                    await ctx.send((f"**Mr.Lobot** asked swgoh.gg for your guild too often, "
+                                    f"your report starts in {int(wait) + 1} seconds"))
+                elif job.ahead > 0 or self.scheduler.busy:
+                    await ctx.send((f"**Mr.Lobot** is busy with other reports, "
+                                    f"yours is queued behind {job.ahead}"))
+                else:
                     await ctx.send((f"Hold on, **Mr.Lobot** is making computations"))
 
-                    mrlobot_sheets_info = self.make_spreadsheets(guild=guild,
-                                                                 char_ids=chars,
-                                                                 stat_opts=opts_to_report[True])
-
-                    for attr, sheet in mrlobot_sheets_info:
-                        filename = f"./{guild}_{sheet_name}_{to_report}.csv"
-
-                        sheet.to_csv(filename, index=False)
-                        await ctx.send(f"Spreadsheet {sheet_name} for {self.VALID_SPREADSHEETS[attr]}")
-                        await ctx.send(file=File(filename))
-
-                        os.remove(filename)
-
-                else:
-                    await ctx.send((f"**Mr.Lobot** did not locate the spreadsheet **{sheet_name}** "
-                                    f"on his database."))
+                if is_new:
+                    await job
             else:
                 await ctx.send((f"**Mr.Lobot** did not locate any stat to report"))
         except Exception as ex:
@@ -560,6 +812,190 @@ class MrSpreadsheet(Cog):
                     logger.error(ex)
         except Exception as ex:
             raise ex
+
+    MAX_CHANGES = 15
+
+    @command(name="mrlobot_changes", aliases=["changes", "ch"])
+    async def mrlobot_changes(self, ctx):
+        try:
+            guild = await self.get_guild(ctx.guild.id)
+            cached = self.report_states.get(str(guild))
+
+            if cached is None or cached[1] is None:
+                await ctx.send((f"**Mr.Lobot** needs two reports of your guild to find what changed, "
+                                f"use **+report** with the **refresh** option"))
+                return
+
+            state, previous = cached
+            diff = await self.executor.run(diff_states, previous, state)
+
+            if diff.empty:
+                await ctx.send(f"**Mr.Lobot** did not find any change since the last report")
+                return
+
+            embed = Embed(title=f"Changes since the last report")
+
+            if len(diff.joined) > 0:
+                embed.add_field(name="Players joined",
+                                value="\n".join(map(lambda x: f"> {x}", diff.joined)))
+
+            if len(diff.left) > 0:
+                embed.add_field(name="Players left",
+                                value="\n".join(map(lambda x: f"> {x}", diff.left)))
+
+            if len(diff.changed) > 0:
+                changes = [f"> {row.player}: {self.chars.base_id_names.get(row.base_id, row.base_id)} "
+                           f"{row.stat} {row.old} → {row.new}"
+                           for row in diff.changed.head(self.MAX_CHANGES).itertuples()]
+
+                if len(diff.changed) > self.MAX_CHANGES:
+                    changes.append(f"> ... and {len(diff.changed) - self.MAX_CHANGES} more")
+
+                embed.add_field(name="Units changed",
+                                value="\n".join(changes),
+                                inline=False)
+
+            await ctx.send(embed=embed)
+        except Exception as ex:
+            logger.error(ex)
+            raise
+
+    @mrlobot_changes.error
+    async def on_mrlobot_changes_error(self, ctx, ex):
+        try:
+            if not isinstance(ex, commands.MissingRequiredArgument):
+                if hasattr(ex, "original"):
+                    await ctx.send(ex.original)
+                else:
+                    logger.error(
+                        "Unknown exception @on_mrlobot_changes_error")
+                    logger.error(ex)
+        except Exception as ex:
+            raise ex
+
+    # Bot wide numbers, every server's, only for the bot admins (MRLOBOT_ADMINS)
+    @command(name="mrlobot_stats", aliases=["stats"])
+    @commands.is_owner()
+    async def mrlobot_stats(self, ctx, option: Optional[str]):
+        try:
+            if option == "raw":
+                metrics = REGISTRY.render().encode("utf-8")
+                await ctx.send(f"**Mr.Lobot** metrics in Prometheus format",
+                               file=File(io.BytesIO(metrics), filename="metrics.txt"))
+                return
+
+            embed = Embed(title=f"Mr.Lobot stats",
+                          description=f"Calls, p50 and p99 per command, provider and upstream")
+
+            embed.add_field(name="Commands",
+                            value=self.__histogram_lines(COMMAND_SECONDS),
+                            inline=False)
+            embed.add_field(name="Providers",
+                            value=self.__histogram_lines(PROVIDER_SECONDS),
+                            inline=False)
+            embed.add_field(name="Upstream",
+                            value=self.__histogram_lines(UPSTREAM_SECONDS),
+                            inline=False)
+            embed.add_field(name="Report stages",
+                            value=self.__histogram_lines(STAGE_SECONDS),
+                            inline=False)
+
+            downloaded = [f"> {dict(key)['host']}: {value / (1024 * 1024):.1f} MB"
+                          for key, value in UPSTREAM_BYTES.values.items()]
+            embed.add_field(name="Downloaded",
+                            value="\n".join(downloaded) if len(downloaded) > 0 else "> Nothing yet")
+
+            caches = []
+            for name, cache in REGISTRY.caches.items():
+                stats = cache.stats()
+                lookups = stats["hits"] + stats["misses"]
+                ratio = stats["hits"] / lookups if lookups > 0 else 0
+                caches.append(f"> {name}: {ratio:.0%} hits, {stats['entries']} entries, "
+                              f"{stats['bytes'] / (1024 * 1024):.1f} MB")
+            embed.add_field(name="Caches", value="\n".join(caches))
+
+            embed.add_field(name="Reports",
+                            value=f"> {self.scheduler.queued} queued, {self.scheduler.running} running",
+                            inline=False)
+
+            await ctx.send(embed=embed)
+        except Exception as ex:
+            logger.error(ex)
+            raise
+
+    def __command_names(self) -> dict:
+        # {name or alias: name} of the commands of this cog
+        names = {}
+        for cmd in self.get_commands():
+            names.update({alias: cmd.name for alias in [cmd.name, *cmd.aliases]})
+        return names
+
+    # Profiles every server's calls and slows the loop down, bot admins only
+    @command(name="mrlobot_profile", aliases=["profile"])
+    @commands.is_owner()
+    async def mrlobot_profile(self, ctx, action: str, name: Optional[str] = None,
+                              times: Optional[int] = 1, upload: Optional[str] = None):
+        try:
+            if action == "status":
+                armed = [f"> +{request.command}: {request.remaining} left"
+                         f"{', uploaded' if request.channel is not None else ''}"
+                         for request in self.profiler.armed.values()]
+                await ctx.send((f"**Mr.Lobot** is profiling with {self.profiler.kind}:\n" + "\n".join(armed))
+                               if len(armed) > 0 else f"**Mr.Lobot** is not profiling any command")
+                return
+
+            if action not in ["on", "off"] or name is None:
+                await ctx.send((f"Use **+mrlobot_profile on \\command\\ [times] [upload]**, "
+                                f"**+mrlobot_profile off \\command\\** or **+mrlobot_profile status**"))
+                return
+
+            command_name = self.__command_names().get(name)
+
+            if command_name is None or command_name == ctx.command.name:
+                await ctx.send(f"**Mr.Lobot** cannot profile **{name}**")
+            elif action == "on":
+                channel = ctx.channel if upload == "upload" else None
+                times = self.profiler.arm(command_name, times or 1, channel)
+                await ctx.send((f"**Mr.Lobot** will profile the next {times} call(s) of "
+                                f"**+{command_name}** with {self.profiler.kind}, "
+                                f"saved to **{self.profiler.path}**"
+                                f"{' and uploaded here' if channel is not None else ''}"))
+            elif self.profiler.disarm(command_name):
+                await ctx.send(f"**Mr.Lobot** stopped profiling **+{command_name}**")
+            else:
+                await ctx.send(f"**Mr.Lobot** was not profiling **+{command_name}**")
+        except Exception as ex:
+            logger.error(ex)
+            raise
+
+    @mrlobot_profile.error
+    async def on_mrlobot_profile_error(self, ctx, ex):
+        try:
+            if isinstance(ex, commands.NotOwner):
+                await ctx.send(f"Only the **Mr.Lobot** admins can profile it")
+            elif not isinstance(ex, commands.MissingRequiredArgument):
+                if hasattr(ex, "original"):
+                    await ctx.send(ex.original)
+                else:
+                    logger.error(
+                        "Unknown exception @on_mrlobot_profile_error")
+                    logger.error(ex)
+        except Exception as ex:
+            raise ex
+
+    @mrlobot_stats.error
+    async def on_mrlobot_stats_error(self, ctx, ex):
+        try:
+            if isinstance(ex, commands.NotOwner):
+                await ctx.send(f"Only the **Mr.Lobot** admins can see its stats")
+            elif hasattr(ex, "original"):
+                await ctx.send(ex.original)
+            else:
+                logger.error(
+                    "Unknown exception @on_mrlobot_stats_error")
+                logger.error(ex)
+        except Exception as ex:
+            raise ex
     # endregion
 
 
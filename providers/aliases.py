@@ -0,0 +1,144 @@
+import string
+
+from collections import Counter
+from typing import Iterator, List
+from unidecode import unidecode
+from nltk import ngrams
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+NGRAM_SIZES = [1, 2, 3]
+
+
+def plain_name(name: str) -> str:
+    name = unidecode(name)
+    return name.translate(str.maketrans('', '', string.punctuation))
+
+
+def char_ngrams(name: str) -> Iterator[str]:
+    # Every 1-3 gram of the name, in a single pass over its words
+    words = plain_name(name).split()
+
+    for n in NGRAM_SIZES:
+        for gram in ngrams(words, n):
+            yield " ".join(gram)
+
+
+class AliasIndex(object):
+    def __init__(self) -> None:
+        # How many times each n-gram shows up among all the names
+        self.__counts = Counter()
+        # {ngram: set(ids)} to find the chars an n-gram change affects
+        self.__owners = {}
+        # {id: {name:str, id:int, aliases:set(), base_id:str}}
+        self.__chars = {}
+        # {id: (ngram, ...)}
+        self.__ngrams = {}
+
+    # region aux functions
+    def __add(self, id: int, name: str) -> List[str]:
+        grams = tuple(char_ngrams(name))
+        self.__ngrams[id] = grams
+        self.__counts.update(grams)
+
+        for gram in grams:
+            self.__owners.setdefault(gram, set()).add(id)
+
+        return grams
+
+    def __remove(self, id: int) -> List[str]:
+        grams = self.__ngrams.pop(id)
+        self.__counts.subtract(grams)
+
+        for gram in grams:
+            if self.__counts[gram] <= 0:
+                del self.__counts[gram]
+            owners = self.__owners.get(gram)
+            if owners is not None:
+                owners.discard(id)
+                if len(owners) == 0:
+                    del self.__owners[gram]
+
+        return grams
+
+    def __aliases(self, id: int, name: str) -> set:
+        aliases = set([gram for gram in self.__ngrams[id]
+                       if self.__counts[gram] == 1])
+
+        if len(aliases) == 0:
+            aliases = set([plain_name(name)])
+
+        return aliases
+    # endregion
+
+    # region externally used
+    def load(self, chars: list, id_chars: dict):
+        # Seeds the index from a catalog snapshot, its aliases are kept as
+        # they were so the next update only recomputes what changed
+        try:
+            self.__counts = Counter()
+            self.__owners = {}
+            self.__ngrams = {}
+
+            for char in chars:
+                self.__add(char["id"], char["name"])
+
+            self.__chars = {id: dict(char) for id, char in id_chars.items()}
+        except Exception as ex:
+            logger.error(ex)
+            raise
+
+    def update(self, chars: list) -> dict:
+        # chars as [{id:int, name:str, base_id:str}], the whole current catalog
+        try:
+            new_chars = {char["id"]: char for char in chars}
+
+            removed = [id for id in self.__chars if id not in new_chars]
+            renamed = [id for id, char in new_chars.items()
+                       if id in self.__chars and self.__chars[id]["name"] != char["name"]]
+            added = [id for id in new_chars if id not in self.__chars]
+
+            touched = set()
+            for id in [*removed, *renamed]:
+                touched.update(self.__remove(id))
+            for id in [*renamed, *added]:
+                touched.update(self.__add(id, new_chars[id]["name"]))
+
+            # Only the chars sharing a touched n-gram can win or lose aliases
+            dirty = set([*renamed, *added])
+            for gram in touched:
+                dirty.update(self.__owners.get(gram, ()))
+
+            res_chars = {}
+            for id, char in new_chars.items():
+                previous = self.__chars.get(id)
+
+                if id in dirty or previous is None:
+                    aliases = self.__aliases(id, char["name"])
+
+                    # Unique aliases shared now with a new or renamed unit
+                    if previous is not None and previous["name"] == char["name"]:
+                        lost = previous["aliases"] - aliases
+                        if len(lost) > 0:
+                            logger.info(f"Aliases {lost} of {char['name']} are no longer unique")
+                else:
+                    aliases = previous["aliases"]
+
+                res_chars[id] = {"name": char["name"],
+                                 "id": char["id"],
+                                 "aliases": aliases,
+                                 "base_id": char["base_id"]}
+
+            if len(self.__chars) > 0:
+                logger.info(f"Aliases updated: {len(added)} added, {len(renamed)} renamed, "
+                            f"{len(removed)} removed, {len(dirty)} recomputed")
+
+            self.__chars = res_chars
+
+            return dict(res_chars)
+        except Exception as ex:
+            logger.error(ex)
+            raise
+    # endregion
@@ -0,0 +1,112 @@
+import time
+
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class TTLCache(object):
+    def __init__(self, ttl: float, max_bytes: int, stale_ttl: float = 0) -> None:
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # Expired entries are kept this long after the ttl, see get_stale
+        self.stale_ttl = stale_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+
+        # {key: (value, size, stored_at)}, oldest used first
+        self.__entries = OrderedDict()
+
+    # region aux functions
+    def __drop(self, key: Hashable):
+        _, size, _ = self.__entries.pop(key)
+        self.nbytes -= size
+
+    def __evict(self):
+        while self.nbytes > self.max_bytes and len(self.__entries) > 0:
+            key = next(iter(self.__entries))
+            self.__drop(key)
+            self.evictions += 1
+            logger.info(f"Evicted {key} from cache")
+    # endregion
+
+    # region externally used
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.__entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, _, stored_at = entry
+        age = time.monotonic() - stored_at
+
+        if age > self.ttl:
+            if age > self.ttl + self.stale_ttl:
+                self.__drop(key)
+            self.misses += 1
+            return None
+
+        self.__entries.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def get_stale(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        # (value, age) even if expired, for when the source cannot be reached
+        entry = self.__entries.get(key)
+
+        if entry is None:
+            return None
+
+        value, _, stored_at = entry
+        age = time.monotonic() - stored_at
+
+        if age > self.ttl + self.stale_ttl:
+            self.__drop(key)
+            return None
+
+        return value, age
+
+    def fresh(self, key: Hashable) -> bool:
+        # Whether get would hit, without counting it as a lookup
+        entry = self.__entries.get(key)
+        return entry is not None and time.monotonic() - entry[2] <= self.ttl
+
+    def put(self, key: Hashable, value: Any, size: int):
+        if key in self.__entries:
+            self.__drop(key)
+
+        # Values bigger than the whole cache are never stored
+        if size > self.max_bytes:
+            return
+
+        self.__entries[key] = (value, size, time.monotonic())
+        self.nbytes += size
+        self.__evict()
+
+    def invalidate(self, key: Hashable):
+        if key in self.__entries:
+            self.__drop(key)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.__entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.__entries
+    # endregion
@@ -0,0 +1,101 @@
+from bisect import bisect_left
+from types import MappingProxyType
+from typing import Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+from providers.fuzzy import MIN_SCORE, FuzzyResolver
+from providers.aliases import plain_name
+
+
+def normalize(text: str) -> str:
+    return plain_name(text).lower().strip()
+
+
+class CharCatalog(NamedTuple):
+    # Indexes are built once, lookups never scan the whole catalog
+    id_names: Mapping[int, str]
+    id_base_ids: Mapping[int, str]
+    base_id_names: Mapping[str, str]
+    alias_ids: Mapping[str, int]
+    name_aliases: Mapping[str, tuple]
+    # Sorted normalized names and aliases, prefix_names[i] owns prefix_keys[i]
+    prefix_keys: Tuple[str, ...]
+    prefix_names: Tuple[str, ...]
+    # Trigram index over the same keys for typo tolerant lookups
+    fuzzy: FuzzyResolver
+
+    def resolve(self, alias: str) -> Optional[int]:
+        return self.alias_ids.get(alias)
+
+    def guess(self, text: str, min_score: float = MIN_SCORE) -> Optional[Tuple[int, float]]:
+        # Best (id, score) for a misspelled alias, score goes from min_score to 1
+        return self.fuzzy.resolve(normalize(text), min_score)
+
+    def names(self, ids: Iterable[int]) -> List[str]:
+        # Unique names, in the same order as the ids
+        names = (self.id_names.get(int(id)) for id in ids)
+        return [*dict.fromkeys(name for name in names if name is not None)]
+
+    def base_ids(self, ids: Iterable[int]) -> List[str]:
+        base_ids = (self.id_base_ids.get(int(id)) for id in ids)
+        return [*dict.fromkeys(base_id for base_id in base_ids if base_id is not None)]
+
+    def starting_with(self, prefix: Optional[str]) -> List[str]:
+        # Names whose name or any alias starts with the prefix, sorted
+        prefix = normalize(prefix or "")
+        names = set()
+
+        ix = bisect_left(self.prefix_keys, prefix)
+        while ix < len(self.prefix_keys) and self.prefix_keys[ix].startswith(prefix):
+            names.add(self.prefix_names[ix])
+            ix += 1
+
+        return sorted(names)
+
+
+def build_catalog(id_chars: dict) -> CharCatalog:
+    # id_chars as {id: {name:str, id:int, aliases:set(), base_id:str}}
+    id_names = {}
+    id_base_ids = {}
+    base_id_names = {}
+    alias_ids = {}
+    name_aliases = {}
+    prefixes = set()
+    fuzzy_keys = {}
+
+    for char in id_chars.values():
+        id_names[char["id"]] = char["name"]
+        id_base_ids[char["id"]] = char["base_id"]
+        base_id_names[char["base_id"]] = char["name"]
+        name_aliases[char["name"]] = tuple(sorted(char["aliases"]))
+
+        prefixes.add((normalize(char["name"]), char["name"]))
+        fuzzy_keys[normalize(char["name"])] = char["id"]
+
+        for alias in char["aliases"]:
+            alias_ids[alias] = char["id"]
+            prefixes.add((normalize(alias), char["name"]))
+            fuzzy_keys[normalize(alias)] = char["id"]
+
+    prefixes = sorted(prefixes)
+
+    return CharCatalog(id_names=MappingProxyType(id_names),
+                       id_base_ids=MappingProxyType(id_base_ids),
+                       base_id_names=MappingProxyType(base_id_names),
+                       alias_ids=MappingProxyType(alias_ids),
+                       name_aliases=MappingProxyType(name_aliases),
+                       prefix_keys=tuple(key for key, _ in prefixes),
+                       prefix_names=tuple(name for _, name in prefixes),
+                       fuzzy=FuzzyResolver(fuzzy_keys))
+
+
+def diff_catalogs(old: CharCatalog, new: CharCatalog) -> dict:
+    added = [name for id, name in new.id_names.items() if id not in old.id_names]
+    removed = [name for id, name in old.id_names.items() if id not in new.id_names]
+    renamed = [(old.id_names[id], name) for id, name in new.id_names.items()
+               if id in old.id_names and old.id_names[id] != name]
+
+    return {
+        "added": added,
+        "removed": removed,
+        "renamed": renamed
+    }
@@ -0,0 +1,156 @@
+import os
+import time
+import asyncio
+import aiohttp
+
+from typing import Dict, Mapping, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+from utils.logger import get_logger
+from utils.exc import CircuitOpenException
+from utils.metrics import UPSTREAM_BYTES, UPSTREAM_RETRIES, UPSTREAM_SECONDS
+from providers.resilience import CircuitBreaker, HTTP_RETRIES, HTTP_RETRY_AFTER_CAP, \
+    IDEMPOTENT_METHODS, TRANSIENT_STATUSES, backoff, retry_after
+
+logger = get_logger(__name__)
+
+# Pool config, can be overriden through the .env file
+HTTP_TOTAL_TIMEOUT = float(os.getenv("HTTP_TOTAL_TIMEOUT", 30))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 10))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", 30))
+
+
+class Response(NamedTuple):
+    status_code: int
+    content: bytes
+    # Case insensitive, as sent by the server
+    headers: Mapping[str, str]
+
+
+class HTTPClient(object):
+    def __init__(self,
+                 total_timeout: float = HTTP_TOTAL_TIMEOUT,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 limit: int = HTTP_POOL_LIMIT,
+                 limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+                 keepalive: float = HTTP_KEEPALIVE,
+                 retries: int = HTTP_RETRIES) -> None:
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout,
+                                             connect=connect_timeout)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive = keepalive
+        self.retries = retries
+
+        self.__session: Optional[aiohttp.ClientSession] = None
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    # region aux functions
+    def __get_session(self) -> aiohttp.ClientSession:
+        # The session is created lazily, it has to live inside the running loop
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=self.keepalive)
+            self.__session = aiohttp.ClientSession(connector=connector,
+                                                   timeout=self.timeout)
+
+        return self.__session
+
+    def __breaker(self, host: str) -> CircuitBreaker:
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(host)
+        return breaker
+
+    async def __send(self, method: str, url: str, host: str, **kwargs) -> Response:
+        start = time.perf_counter()
+        status = "error"
+        try:
+            session = self.__get_session()
+
+            async with session.request(method, url, **kwargs) as response:
+                content = await response.read()
+                status = response.status
+                UPSTREAM_BYTES.inc(len(content), host=host)
+
+                return Response(status_code=response.status,
+                                content=content,
+                                headers=response.headers)
+        except asyncio.TimeoutError as ex:
+            logger.error(f"Timeout while requesting {method} {url}")
+            raise ex
+        except Exception as ex:
+            logger.error(ex)
+            raise ex
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - start,
+                                     host=host, method=method, status=status)
+    # endregion
+
+    # region externally used
+    async def request(self, method: str, url: str, **kwargs) -> Response:
+        # Idempotent requests are retried on network errors and transient
+        # statuses, every request goes through the breaker of its host
+        host = urlsplit(url).netloc
+        breaker = self.__breaker(host)
+        attempts = self.retries + 1 if method.upper() in IDEMPOTENT_METHODS else 1
+
+        for attempt in range(attempts):
+            if not breaker.allow():
+                raise CircuitOpenException(host,
+                                           f"**Mr.Lobot** cannot reach {host} right now, "
+                                           f"try again in {int(breaker.retry_in) + 1} seconds")
+
+            wait = None
+            try:
+                response = await self.__send(method, url, host, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                breaker.record_failure()
+                if attempt == attempts - 1:
+                    raise
+            else:
+                if response.status_code not in TRANSIENT_STATUSES:
+                    breaker.record_success()
+                    return response
+
+                breaker.record_failure()
+                wait = retry_after(response.headers)
+                if attempt == attempts - 1 or (wait is not None and wait > HTTP_RETRY_AFTER_CAP):
+                    return response
+
+            if wait is None:
+                wait = backoff(attempt)
+
+            logger.warning(f"Retrying {method} {url} in {wait:.2f}s ({attempt + 1}/{attempts - 1})")
+            UPSTREAM_RETRIES.inc(host=host)
+            await asyncio.sleep(wait)
+
+    async def get(self, url: str, **kwargs) -> Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    async def close(self):
+        if self.__session is not None and not self.__session.closed:
+            await self.__session.close()
+    # endregion
+
+
+# Every provider shares the same pool
+_client = None
+
+
+def get_client() -> HTTPClient:
+    global _client
+
+    if _client is None:
+        _client = HTTPClient()
+
+    return _client
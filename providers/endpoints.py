@@ -1,22 +1,31 @@
 import os
 import json
-from typing import List
-import requests
+import asyncio
+from typing import Dict, Iterable, List, Optional
 
 from dotenv import load_dotenv
 
 from utils.logger import get_logger
 from utils.exc import EndpointException
+from utils.metrics import timed
+from providers.client import get_client
+from providers.singleflight import SingleFlight
 from pdb import set_trace as bp
 
 logger = get_logger(__name__)
 
+# Max concurrent lookups while warming up the server -> guild mappings
+WARMUP_CONCURRENCY = int(os.getenv("MRLOBOT_WARMUP_CONCURRENCY", 5))
+
 
 class MrLobotStorageEndpoint(object):
     def __init__(self) -> None:
         self.endpoint = os.getenv("MRLOBOT_ENDPOINT")
+        self.client = get_client()
+        self.inflight = SingleFlight()
 
-    def register_guild(self, server: str,  guild: str):
+    @timed("storage.register_guild")
+    async def register_guild(self, server: str,  guild: str):
         try:
             payload = {
                 "server": str(server),
@@ -27,7 +36,7 @@ class MrLobotStorageEndpoint(object):
 
             # endpoint/register -> put
             ep = f"{self.endpoint}register"
-            response = requests.put(ep, data=json.dumps(payload))
+            response = await self.client.put(ep, data=json.dumps(payload))
 
             if response.status_code == 200:
                 content = json.loads(response.content)
@@ -68,11 +77,39 @@ class MrLobotStorageEndpoint(object):
             logger.error(ex)
             raise
 
-    def guild_servers(self, srvr: str) -> list:
+    @timed("storage.guild_servers")
+    async def guild_servers(self, srvr: str) -> list:
+        # Lookups of the same server share a single request
+        return await self.inflight.do(("srvrs", str(srvr)), self.__guild_servers, srvr)
+
+    async def guild_servers_batch(self, srvrs: Iterable[str],
+                                  concurrency: int = WARMUP_CONCURRENCY) -> Dict[str, Optional[str]]:
+        # The storage has no bulk route, lookups are bounded instead of
+        # hitting it all at once. Failed servers are left out.
+        semaphore = asyncio.Semaphore(concurrency)
+        srvr_guilds = {}
+
+        async def lookup(srvr):
+            async with semaphore:
+                try:
+                    response = await self.guild_servers(srvr)
+                except Exception as ex:
+                    logger.error(f"Warmup failed for server {srvr}: {ex}")
+                    return
+
+                items = response["content"] or []
+                srvr_guilds[str(srvr)] = None
+                srvr_guilds.update({item["srvr"]: item["guild"] for item in items})
+
+        await asyncio.gather(*[lookup(srvr) for srvr in srvrs])
+
+        return srvr_guilds
+
+    async def __guild_servers(self, srvr: str) -> list:
         try:
             # endpoint/srvrs/{id} -> get
             ep = f"{self.endpoint}srvrs/{srvr}"
-            response = requests.get(ep)
+            response = await self.client.get(ep)
 
             if response.status_code == 200:
                 content = json.loads(response.content)
@@ -103,7 +140,8 @@ class MrLobotStorageEndpoint(object):
             logger.error(ex)
             raise ex
 
-    def add_to_spreadsheet(self, sheet: str, guild: str, chars: List[int]):
+    @timed("storage.add_to_spreadsheet")
+    async def add_to_spreadsheet(self, sheet: str, guild: str, chars: List[int]):
         try:
             # endopoint/spreadsheet/sheet_name -> put
             ep = f"{self.endpoint}spreadsheet/{sheet}"
@@ -112,7 +150,7 @@ class MrLobotStorageEndpoint(object):
                 "chars": chars
             }
 
-            response = requests.put(ep, data=json.dumps(payload))
+            response = await self.client.put(ep, data=json.dumps(payload))
 
             if response.status_code == 200:
                 content = json.loads(response.content)
@@ -149,7 +187,8 @@ class MrLobotStorageEndpoint(object):
             logger.error(ex)
             raise ex
 
-    def remove_to_spreadsheet(self, sheet: str, guild: str, chars: List[int] = []):
+    @timed("storage.remove_to_spreadsheet")
+    async def remove_to_spreadsheet(self, sheet: str, guild: str, chars: List[int] = []):
         try:
             # endopoint/spreadsheet/sheet_name -> delete
             ep = f"{self.endpoint}spreadsheet/{sheet}"
@@ -161,7 +200,7 @@ class MrLobotStorageEndpoint(object):
             if len(chars) != 0:
                 payload["chars"] = chars
 
-            response = requests.delete(ep, data=json.dumps(payload))
+            response = await self.client.delete(ep, data=json.dumps(payload))
 
             if response.status_code == 200:
                 content = json.loads(response.content)
@@ -204,11 +243,12 @@ class MrLobotStorageEndpoint(object):
             logger.error(ex)
             raise ex
 
-    def get_spreadsheet(self, guild: str, sheet: str):
+    @timed("storage.get_spreadsheet")
+    async def get_spreadsheet(self, guild: str, sheet: str):
         try:
             # endopoint/spreadsheet/guild -> get
             ep = f"{self.endpoint}spreadsheet/{sheet}/{guild}"
-            response = requests.get(ep)
+            response = await self.client.get(ep)
 
             if response.status_code == 200:
                 content = json.loads(response.content)
@@ -241,11 +281,12 @@ class MrLobotStorageEndpoint(object):
             logger.error(ex)
             raise ex
 
-    def guild_spreadsheets(self, guild: str, start_expression: str):
+    @timed("storage.guild_spreadsheets")
+    async def guild_spreadsheets(self, guild: str, start_expression: str):
         try:
             # endopoint/spreadsheets/guild?options -> get
             ep = f"{self.endpoint}spreadsheets/{guild}?start={start_expression}"
-            response = requests.get(ep)
+            response = await self.client.get(ep)
 
             if response.status_code == 200:
                 content = json.loads(response.content)
@@ -0,0 +1,84 @@
+from collections import Counter
+from typing import Iterator, List, Mapping, Optional, Tuple
+
+N = 3
+MAX_CANDIDATES = 8
+# Lowest score resolve returns unless told otherwise
+MIN_SCORE = 0.5
+
+
+def trigrams(text: str) -> Iterator[str]:
+    # Padded so short words and word boundaries still get trigrams
+    text = f"{' ' * (N - 1)}{text} "
+    return (text[ix:ix + N] for ix in range(len(text) - N + 1))
+
+
+def bounded_distance(a: str, b: str, bound: int) -> int:
+    # Levenshtein distance, gives up with bound + 1 once it cannot be <= bound.
+    # Only the cells within bound of the diagonal can stay under it.
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+
+    over = bound + 1
+    previous = [jx if jx <= bound else over for jx in range(len(b) + 1)]
+    for ix, ca in enumerate(a, start=1):
+        current = [ix if ix <= bound else over] + [over] * len(b)
+        lowest = current[0]
+
+        for jx in range(max(1, ix - bound), min(len(b), ix + bound) + 1):
+            value = min(previous[jx] + 1,
+                        current[jx - 1] + 1,
+                        previous[jx - 1] + (ca != b[jx - 1]))
+            current[jx] = value
+            lowest = min(lowest, value)
+
+        if lowest > bound:
+            return over
+        previous = current
+
+    return min(previous[-1], over)
+
+
+class FuzzyResolver(object):
+    def __init__(self, keys: Mapping[str, int], max_candidates: int = MAX_CANDIDATES) -> None:
+        # keys as {normalized alias or name: id}
+        self.max_candidates = max_candidates
+
+        self.__keys: List[str] = [*keys]
+        self.__ids: List[int] = [*keys.values()]
+        # {trigram: [key index]}
+        self.__index = {}
+
+        for ix, key in enumerate(self.__keys):
+            for gram in set(trigrams(key)):
+                self.__index.setdefault(gram, []).append(ix)
+
+    def resolve(self, text: str, min_score: float = MIN_SCORE) -> Optional[Tuple[int, float]]:
+        grams = set(trigrams(text))
+
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.__index.get(gram, ()))
+
+        if len(shared) == 0:
+            return None
+
+        # Only the keys sharing most trigrams are compared char by char
+        best = None
+        for ix, _ in shared.most_common(self.max_candidates):
+            key = self.__keys[ix]
+            length = max(len(key), len(text))
+            # Edits allowed to still reach min_score (or the best so far),
+            # a tight bound lets bounded_distance give up early
+            floor = min_score if best is None else max(min_score, best[1])
+            bound = int(length * (1 - floor) + 1e-9)
+
+            distance = bounded_distance(text, key, bound)
+            if distance > bound:
+                continue
+
+            score = 1 - distance / length
+            if best is None or score > best[1]:
+                best = (self.__ids[ix], score)
+
+        return best
@@ -0,0 +1,105 @@
+import os
+import time
+import random
+
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Retries of idempotent requests, configurable through the .env file
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.5))
+HTTP_BACKOFF_CAP = float(os.getenv("HTTP_BACKOFF_CAP", 10))
+# Longer Retry-After values are not waited for, the call fails instead
+HTTP_RETRY_AFTER_CAP = float(os.getenv("HTTP_RETRY_AFTER_CAP", 30))
+# Consecutive failures that open the breaker of a host, and seconds it stays open
+BREAKER_FAILURES = int(os.getenv("HTTP_BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.getenv("HTTP_BREAKER_RESET", 30))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Upstream answers worth a retry, anything else is final
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+
+def backoff(attempt: int, base: float = HTTP_BACKOFF_BASE, cap: float = HTTP_BACKOFF_CAP) -> float:
+    # Full jitter, retries of many clients do not land at the same time
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    # Seconds asked by the server, either as a number or as an HTTP date
+    value = headers.get("Retry-After") if headers is not None else None
+
+    if value is None:
+        return None
+
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker(object):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, host: str, failures: int = BREAKER_FAILURES, reset: float = BREAKER_RESET) -> None:
+        self.host = host
+        self.max_failures = failures
+        self.reset = reset
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+
+    # region aux functions
+    def __open(self):
+        if self.state != self.OPEN:
+            logger.warning(f"Circuit for {self.host} opened after {self.failures} failures")
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+    # endregion
+
+    # region externally used
+    @property
+    def retry_in(self) -> float:
+        # Seconds until a trial request is let through
+        if self.state == self.CLOSED:
+            return 0
+        return max(0, self.reset - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+
+        # A single trial request per reset period, the rest keep failing fast.
+        # The trial may never report back if it gets cancelled
+        if time.monotonic() - self.opened_at >= self.reset:
+            self.state = self.HALF_OPEN
+            self.opened_at = time.monotonic()
+            logger.info(f"Circuit for {self.host} half open")
+            return True
+
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit for {self.host} closed")
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+
+        if self.state == self.HALF_OPEN or self.failures >= self.max_failures:
+            self.__open()
+    # endregion
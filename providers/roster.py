@@ -0,0 +1,91 @@
+import io
+import time
+import ijson
+
+import numpy as np
+import pandas as pd
+
+from typing import List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Unit stats pulled from players[].units[].data, nulls are stored as 0
+UNIT_FIELDS = {
+    "power": np.int32,
+    "relic_tier": np.int8,
+    "gear_level": np.int8,
+    "rarity": np.int8,
+    "level": np.int16,
+}
+
+GUILD_PREFIX = "data"
+PLAYER_PREFIX = "players.item"
+
+
+class Roster(object):
+    def __init__(self, guild: str, info: Optional[dict], players: List[str], ally_codes: List[Optional[int]],
+                 units: pd.DataFrame) -> None:
+        self.guild = str(guild)
+        # Guild data as sent by swgoh.gg, None when the guild does not exist
+        self.info = info
+        # Player names, units["player"] indexes this list
+        self.players = players
+        self.ally_codes = ally_codes
+        # Long table (player, base_id, *UNIT_FIELDS), one row per unit
+        self.units = units
+        self.fetched_at = time.time()
+
+    @property
+    def nbytes(self) -> int:
+        names = sum(len(name or "") for name in self.players)
+        return int(self.units.memory_usage(deep=True).sum()) + names
+
+    @property
+    def keys(self) -> List[str]:
+        # Stable player ids to diff rosters, names can change or repeat
+        return [str(code) if code is not None else f"{name}#{ix}"
+                for ix, (name, code) in enumerate(zip(self.players, self.ally_codes))]
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+def parse_guild(guild: str, raw: bytes) -> Roster:
+    try:
+        players = []
+        ally_codes = []
+
+        columns = {"player": [], "base_id": []}
+        columns.update({field: [] for field in UNIT_FIELDS})
+
+        # A player at a time, only its unit stats are kept. ijson builds the
+        # objects in C, a loop over every event is slower than json.loads.
+        for ix, player in enumerate(ijson.items(io.BytesIO(raw), PLAYER_PREFIX, use_float=True)):
+            data = player.get("data") or {}
+            players.append(data.get("name"))
+            ally_codes.append(data.get("ally_code"))
+
+            for unit in player.get("units") or []:
+                unit = unit.get("data") or {}
+                columns["player"].append(ix)
+                columns["base_id"].append(unit.get("base_id"))
+                for field in UNIT_FIELDS:
+                    columns[field].append(unit.get(field) or 0)
+
+        # The guild data is small, it gets a pass of its own
+        info = next(ijson.items(io.BytesIO(raw), GUILD_PREFIX, use_float=True), None)
+
+        units = pd.DataFrame({
+            "player": np.array(columns["player"], dtype=np.int16),
+            "base_id": pd.Categorical(columns["base_id"]),
+            **{field: np.array(columns[field], dtype=dtype)
+               for field, dtype in UNIT_FIELDS.items()}
+        })
+
+        return Roster(guild, info, players, ally_codes, units)
+    except Exception as ex:
+        logger.error(ex)
+        raise
@@ -0,0 +1,43 @@
+import asyncio
+
+from typing import Any, Awaitable, Callable, Hashable
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class SingleFlight(object):
+    def __init__(self) -> None:
+        # {key: future of the request in flight}
+        self.__calls = {}
+        self.coalesced = 0
+
+    # region aux functions
+    def __done(self, key: Hashable, future: asyncio.Future):
+        if self.__calls.get(key) is future:
+            del self.__calls[key]
+
+        # Avoids the "exception never retrieved" warning when every caller left
+        if not future.cancelled():
+            future.exception()
+    # endregion
+
+    # region externally used
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        future = self.__calls.get(key)
+
+        if future is None:
+            future = asyncio.ensure_future(fn(*args, **kwargs))
+            self.__calls[key] = future
+            future.add_done_callback(lambda f: self.__done(key, f))
+        else:
+            self.coalesced += 1
+            logger.info(f"Joining the request in flight for {key}")
+
+        # A cancelled caller must not cancel the request for the rest
+        return await asyncio.shield(future)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.__calls
+    # endregion
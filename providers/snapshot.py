@@ -0,0 +1,62 @@
+import os
+import time
+import pickle
+import hashlib
+
+from pathlib import Path
+from typing import Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SNAPSHOT_PATH = Path(os.getenv("CATALOG_SNAPSHOT", "./cache/catalog.pkl"))
+
+# Bump the version or change the fields and older snapshots are ignored
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FIELDS = ("chars", "id_chars", "etag", "last_modified", "saved_at")
+SCHEMA_HASH = hashlib.sha1(repr((SNAPSHOT_VERSION, SNAPSHOT_FIELDS)).encode()).hexdigest()
+
+
+def save_snapshot(chars: list, id_chars: dict, etag: Optional[str], last_modified: Optional[str],
+                  path: Path = SNAPSHOT_PATH):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        snapshot = {
+            "schema": SCHEMA_HASH,
+            "chars": chars,
+            "id_chars": id_chars,
+            "etag": etag,
+            "last_modified": last_modified,
+            "saved_at": time.time()
+        }
+
+        # Written aside and swapped, a crash never leaves half a snapshot
+        temp = path.with_suffix(".tmp")
+        with open(temp, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, path)
+
+        logger.info(f"Catalog snapshot saved at {path}")
+    except Exception as ex:
+        # A missing snapshot only costs a slower start
+        logger.error(ex)
+
+
+def load_snapshot(path: Path = SNAPSHOT_PATH) -> Optional[dict]:
+    try:
+        if not path.exists():
+            return None
+
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+
+        if snapshot.get("schema") != SCHEMA_HASH:
+            logger.warning(f"Catalog snapshot {path} has another schema, ignoring it")
+            return None
+
+        return snapshot
+    except Exception as ex:
+        logger.error(ex)
+        return None
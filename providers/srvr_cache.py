@@ -0,0 +1,82 @@
+import os
+import time
+import sqlite3
+
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SRVR_CACHE_PATH = Path(os.getenv("SRVR_CACHE_PATH", "./cache/srvr_guilds.sqlite"))
+# Seconds a server -> guild mapping is trusted
+SRVR_CACHE_TTL = float(os.getenv("SRVR_CACHE_TTL", 24 * 60 * 60))
+# Seconds a server without guild is not scanned again
+SRVR_CACHE_NEGATIVE_TTL = float(os.getenv("SRVR_CACHE_NEGATIVE_TTL", 5 * 60))
+
+
+class ServerGuildCache(object):
+    def __init__(self,
+                 path: Path = SRVR_CACHE_PATH,
+                 ttl: float = SRVR_CACHE_TTL,
+                 negative_ttl: float = SRVR_CACHE_NEGATIVE_TTL) -> None:
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.__conn = sqlite3.connect(str(path), isolation_level=None)
+
+        # A NULL guild caches that the server has no guild registered
+        self.__conn.execute("CREATE TABLE IF NOT EXISTS srvr_guilds ("
+                            "srvr TEXT PRIMARY KEY, "
+                            "guild TEXT, "
+                            "stored_at REAL NOT NULL)")
+
+    # region externally used
+    def get(self, srvr: str) -> Tuple[bool, Optional[str]]:
+        # (hit, guild), guild is None on a cached "no guild"
+        try:
+            row = self.__conn.execute("SELECT guild, stored_at FROM srvr_guilds WHERE srvr = ?",
+                                      (str(srvr),)).fetchone()
+
+            if row is None:
+                return False, None
+
+            guild, stored_at = row
+            ttl = self.ttl if guild is not None else self.negative_ttl
+
+            if time.time() - stored_at > ttl:
+                return False, None
+
+            return True, guild
+        except Exception as ex:
+            # The backing store is still there on a local cache failure
+            logger.error(ex)
+            return False, None
+
+    def put_many(self, srvr_guilds: Dict[str, Optional[str]]):
+        try:
+            now = time.time()
+            self.__conn.executemany("INSERT OR REPLACE INTO srvr_guilds (srvr, guild, stored_at) "
+                                    "VALUES (?, ?, ?)",
+                                    [(str(srvr), None if guild is None else str(guild), now)
+                                     for srvr, guild in srvr_guilds.items()])
+        except Exception as ex:
+            logger.error(ex)
+
+    def put(self, srvr: str, guild: str):
+        self.put_many({srvr: guild})
+
+    def put_missing(self, srvr: str):
+        self.put_many({srvr: None})
+
+    def invalidate(self, srvr: str):
+        try:
+            self.__conn.execute("DELETE FROM srvr_guilds WHERE srvr = ?", (str(srvr),))
+        except Exception as ex:
+            logger.error(ex)
+
+    def close(self):
+        self.__conn.close()
+    # endregion
@@ -1,38 +1,79 @@
-import requests
+import os
 import json
+import time
+import asyncio
 import pydash
-import string
+import aiohttp
 
-import pandas as pd
-
-from collections import Counter
-from unidecode import unidecode
-from nltk import ngrams
-
-from typing import Tuple
+from typing import Callable, Optional
 
 from utils.logger import get_logger
-from utils.exc import EndpointException
+from utils.exc import CircuitOpenException, EndpointException
+from utils.metrics import timed
+from providers.client import get_client
+from providers.cache import TTLCache
+from providers.resilience import TRANSIENT_STATUSES
+from providers.singleflight import SingleFlight
+from providers.roster import Roster, parse_guild
+from providers.catalog import CharCatalog, build_catalog
+from providers.aliases import AliasIndex
+from providers.snapshot import load_snapshot, save_snapshot
 
 from pdb import set_trace as bp
 
 logger = get_logger(__name__)
 
+# Base url of the swgoh.gg api, it can point to a stand-in server (see bench/)
+SWGOH_API = os.getenv("SWGOH_API", "http://swgoh.gg/api/")
+# Guild payloads are cached in process, configurable through the .env file
+GUILD_CACHE_TTL = float(os.getenv("SWGOH_GUILD_CACHE_TTL", 300))
+GUILD_CACHE_BYTES = int(os.getenv("SWGOH_GUILD_CACHE_BYTES", 64 * 1024 * 1024))
+# Expired guilds are still served for this long while swgoh.gg is down
+GUILD_CACHE_STALE_TTL = float(os.getenv("SWGOH_GUILD_CACHE_STALE_TTL", 6 * 60 * 60))
+# With stale_ok, a guild expired less than this long ago is answered from
+# cache if the download takes longer than the budget, in seconds
+GUILD_CACHE_SWR_TTL = float(os.getenv("SWGOH_GUILD_CACHE_SWR_TTL", 15 * 60))
+GUILD_STALE_BUDGET = float(os.getenv("SWGOH_GUILD_STALE_BUDGET", 2))
+
 
 class SWGOH(object):
     def __init__(self) -> None:
-        self.swgoh_api = "http://swgoh.gg/api/"
+        self.swgoh_api = SWGOH_API
+        self.client = get_client()
+        self.guild_cache = TTLCache(ttl=GUILD_CACHE_TTL,
+                                    max_bytes=GUILD_CACHE_BYTES,
+                                    stale_ttl=GUILD_CACHE_STALE_TTL)
+        self.inflight = SingleFlight()
+        # Guild downloads that can outlive the report that started them
+        self.revalidating = set()
+        self.aliases = AliasIndex()
+
+        # Last catalog built and its validators for conditional requests
+        self.catalog = None
+        self.catalog_at = 0
+        self.etag = None
+        self.last_modified = None
 
     # region aux functions
-    def __read_api(self, endpoint: str) -> dict:
+    async def __read_api(self, endpoint: str, parser: Callable = json.loads,
+                         headers: Optional[dict] = None) -> dict:
         try:
             ep = f"{self.swgoh_api}{endpoint}"
 
-            response = requests.get(ep)
+            response = await self.client.get(ep, headers=headers)
             if response.status_code == 200:
-                res = json.loads(response.content)
+                # Guild payloads are MBs, parsed in a worker thread
+                loop = asyncio.get_event_loop()
+                res = await loop.run_in_executor(None, parser, response.content)
                 return {"ok": 1,
+                        "size": len(response.content),
+                        "headers": response.headers,
                         "content": res}
+            elif response.status_code == 304:
+                return {"ok": 1,
+                        "code": 304,
+                        "headers": response.headers,
+                        "content": None}
             else:
                 message = f"An error ocurred while reading the endpoint {ep}: Status code: {response.status_code}"
                 logger.error(message)
@@ -45,61 +86,150 @@ class SWGOH(object):
             logger.error(ex)
             raise ex
 
-    def __create_char_aliases(self, chars: list):
-        try:
-            alias_ngrams = Counter()
-            res_chars = {}
-
-            def plain_name(name):
-                name = unidecode(name)
-                return name.translate(str.maketrans('', '', string.punctuation))
-
-            # Building 1-3 grams for aliases
-            for n in [1, 2, 3]:
-                temp = pydash.chain(chars)\
-                    .map(lambda x: plain_name(x["name"]).split())\
-                    .map(lambda x: [*ngrams(x, n)])\
-                    .flatten()\
-                    .map(lambda x: " ".join(x))\
-                    .value()
+    def __stale_guild(self, key: str, reason) -> Optional[dict]:
+        stale = self.guild_cache.get_stale(key)
 
-                alias_ngrams.update(temp)
+        if stale is not None:
+            response, age = stale
+            logger.warning(f"Serving guild {key} from {int(age)}s ago: {reason}")
+            return response
 
-            uniques = set(
-                [value for value, count in alias_ngrams.items() if count == 1])
+        return None
 
-            for char in chars:
-                id = char["id"]
-                name = plain_name(char["name"]).split()
+    async def __fetch_guild(self, key: str) -> dict:
+        # The payload is parsed straight into a columnar roster
+        try:
+            response = await self.__read_api(f"guild/{key}",
+                                             parser=lambda raw: parse_guild(key, raw))
+        except (CircuitOpenException, aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            # swgoh.gg is down, an old roster is better than nothing
+            stale = self.__stale_guild(key, ex)
+            if stale is None:
+                raise
+            return stale
+
+        if response["ok"]:
+            self.guild_cache.put(key, response, response["content"].nbytes)
+        elif response["code"] in TRANSIENT_STATUSES:
+            stale = self.__stale_guild(key, response["message"])
+            if stale is not None:
+                return stale
+        else:
+            self.guild_cache.invalidate(key)
+
+        return response
+
+    def __refresh(self, key: str) -> asyncio.Future:
+        # Shares the download with any report waiting for the same guild,
+        # it is referenced until it finishes even if nobody waits for it
+        task = asyncio.ensure_future(self.inflight.do(key, self.__fetch_guild, key))
+        self.revalidating.add(task)
+
+        def done(task):
+            self.revalidating.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning(f"Refresh of guild {key} failed: {task.exception()}")
+
+        task.add_done_callback(done)
+
+        return task
+
+    async def __read_guild(self, guild: str, refresh: bool = False, stale_ok: bool = False) -> dict:
+        key = str(guild)
+
+        if not refresh:
+            cached = self.guild_cache.get(key)
+            if cached is not None:
+                return cached
+
+            stale = self.guild_cache.get_stale(key) if stale_ok else None
+            if stale is not None and stale[1] <= self.guild_cache.ttl + GUILD_CACHE_SWR_TTL:
+                # Recently expired, the old roster is only used if swgoh.gg
+                # is slow and the download goes on in background
+                task = self.__refresh(key)
+                done, _ = await asyncio.wait([task], timeout=GUILD_STALE_BUDGET)
+                if task in done:
+                    return task.result()
+
+                response, age = stale
+                logger.info(f"Guild {key} served {int(age)}s old, swgoh.gg took over {GUILD_STALE_BUDGET}s")
+                return response
+
+        # Concurrent reports of the same guild share a single download
+        return await self.inflight.do(key, self.__fetch_guild, key)
+
+    def __create_char_aliases(self, chars: list):
+        # Only new or renamed units (and the ones sharing n-grams with
+        # them) get their aliases recomputed
+        return self.aliases.update(chars)
+    # endregion
 
-                aliases = []
-                for n in [1, 2, 3]:
-                    aliases += [" ".join(r) for r in [*ngrams(name, n)]]
+    # region externally used
+
+    def load_chars(self) -> Optional[CharCatalog]:
+        # Catalog from the local snapshot, None if there is none usable
+        try:
+            snapshot = load_snapshot()
 
-                aliases = set(aliases).intersection(uniques)
+            if snapshot is None:
+                return None
 
-                if len(aliases) == 0:
-                    aliases = set([plain_name(char["name"])])
+            self.etag = snapshot["etag"]
+            self.last_modified = snapshot["last_modified"]
+            # The next catalog from swgoh.gg is diffed against the snapshot
+            self.aliases.load(snapshot["chars"], snapshot["id_chars"])
+            self.catalog = build_catalog(snapshot["id_chars"])
+            self.catalog_at = snapshot["saved_at"]
 
-                res_chars[id] = {"name": char["name"],
-                                 "id": char["id"],
-                                 "aliases": aliases,
-                                 "base_id": char["base_id"]}
+            logger.info(f"Catalog loaded from the snapshot of {time.ctime(snapshot['saved_at'])}")
 
-            return res_chars
+            return self.catalog
         except Exception as ex:
             logger.error(ex)
-            raise
-    # endregion
+            return None
 
-    # region externally used
+    @property
+    def catalog_age(self) -> float:
+        return time.time() - self.catalog_at
+
+    def __build_catalog(self, chars: list, etag: Optional[str], last_modified: Optional[str]) -> CharCatalog:
+        # CPU bound, it runs in a worker thread
+        # We convert to
+        # {id: {name:str, id:int, aliases:set(), base_id:str}}
+        id_chars = self.__create_char_aliases(chars)
+
+        save_snapshot(chars, id_chars, etag, last_modified)
+
+        # And finally index it by id, base_id, alias and name
+        return build_catalog(id_chars)
+
+    @timed("swgoh.get_chars")
+    async def get_chars(self) -> CharCatalog:
+        # The alias index is not thread safe, a single build at a time
+        return await self.inflight.do("characters", self.__get_chars)
 
-    def get_chars(self) -> Tuple[pd.DataFrame, dict]:
+    async def __get_chars(self) -> CharCatalog:
         try:
-            response = self.__read_api("characters")
+            headers = {}
+            if self.catalog is not None:
+                # Revalidated, swgoh.gg answers 304 if nothing changed
+                if self.etag:
+                    headers["If-None-Match"] = self.etag
+                if self.last_modified:
+                    headers["If-Modified-Since"] = self.last_modified
+
+            response = await self.__read_api("characters", headers=headers)
+
+            if response["ok"] and response.get("code") == 304:
+                logger.info("Catalog not modified")
+                self.catalog_at = time.time()
+                return self.catalog
+
             # We have char from here with
             # [{id:str, name:str, base_id:str (This is for searching in some eps)}]
             if response["ok"]:
+                etag = response["headers"].get("ETag")
+                last_modified = response["headers"].get("Last-Modified")
                 response = response["content"]
 
                 chars = pydash.chain(response)\
@@ -108,30 +238,13 @@ class SWGOH(object):
                                     "base_id": x["base_id"]})\
                     .value()
 
-                # We convert to
-                # {id: {name:str, id:int, aliases:set(), base_id:str}}
-                id_chars = self.__create_char_aliases(chars)
-
-                # And finally
-                # {alias: {name:str, id:int, aliases:set(), base_id:str}
-                alias_chars = {}
-                for char in id_chars.values():
-                    temp = {
-                        alias: {
-                            "alias": alias,
-                            "id": char["id"],
-                            "name": char["name"],
-                            "base_id": char["base_id"]
-                        }
-                        for alias
-                        in char["aliases"]
-                    }
-
-                    alias_chars.update(temp)
-
-                df_alias = pd.DataFrame(alias_chars.values())
-
-                return df_alias, alias_chars
+                loop = asyncio.get_event_loop()
+                self.catalog = await loop.run_in_executor(None, self.__build_catalog,
+                                                          chars, etag, last_modified)
+                self.catalog_at = time.time()
+                self.etag, self.last_modified = etag, last_modified
+
+                return self.catalog
             else:
                 raise EndpointException(
                     self.swgoh_api + "/characters",
@@ -141,14 +254,13 @@ class SWGOH(object):
             logger.error(ex)
             raise ex
 
-    def guild_info(self, guild: str) -> bool:
+    @timed("swgoh.guild_info")
+    async def guild_info(self, guild: str, refresh: bool = False) -> bool:
         try:
-            endpoint = f"guild/{guild}"
-
-            response = self.__read_api(endpoint)
+            response = await self.__read_guild(guild, refresh)
             if response["ok"]:
-                if "data" in response["content"]:
-                    return response["content"]["data"]
+                if response["content"].info is not None:
+                    return response["content"].info
                 else:
                     raise EndpointException(
                         f"{self.swgoh_api}/guild/{guild}",
@@ -163,14 +275,18 @@ class SWGOH(object):
             logger.error(ex)
             raise
 
-    def get_guild_players(self, guild: str) -> pd.DataFrame:
+    def has_guild(self, guild: str) -> bool:
+        # A fresh roster is cached, reading the guild needs no download
+        return self.guild_cache.fresh(str(guild))
+
+    @timed("swgoh.get_guild_players")
+    async def get_guild_players(self, guild: str, refresh: bool = False, stale_ok: bool = False) -> Roster:
+        # With stale_ok, a recently expired roster (see Roster.age) is returned
+        # if swgoh.gg misses the latency budget, and the download finishes in background
         try:
-            response = self.__read_api(f"guild/{guild}")
+            response = await self.__read_guild(guild, refresh, stale_ok)
             if response["ok"]:
-                guild_info = response["content"]
-                players = guild_info["players"]
-
-                return players
+                return response["content"]
             else:
                 raise EndpointException(
                     f"{self.swgoh_api}/guild/{guild}",
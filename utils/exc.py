@@ -11,3 +11,18 @@ class EndpointException(Exception):
         logger.error(message)
 
         super(EndpointException, self).__init__(message)
+
+
+class RateLimitException(Exception):
+    def __init__(self, message):
+        logger.warning(message)
+
+        super(RateLimitException, self).__init__(message)
+
+
+class CircuitOpenException(Exception):
+    def __init__(self, host, message):
+        self.host = host
+        logger.warning(f"Circuit open for {host}")
+
+        super(CircuitOpenException, self).__init__(message)
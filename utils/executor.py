@@ -0,0 +1,54 @@
+import os
+import asyncio
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# thread or process, process pools pickle every argument and result
+REPORT_EXECUTOR = os.getenv("REPORT_EXECUTOR", "thread")
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", 2))
+# Reports running or waiting for a worker, the rest wait for a slot
+REPORT_QUEUE = int(os.getenv("REPORT_QUEUE", 8))
+
+
+class ReportExecutor(object):
+    def __init__(self,
+                 kind: str = REPORT_EXECUTOR,
+                 workers: int = REPORT_WORKERS,
+                 max_pending: int = REPORT_QUEUE) -> None:
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+
+        self.__pool: Executor = ProcessPoolExecutor(max_workers=workers) \
+            if kind == "process" \
+            else ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report")
+        # Created lazily, it has to belong to the running loop
+        self.__slots = None
+
+        logger.info(f"Report executor: {workers} {kind} workers, {max_pending} pending at most")
+
+    @property
+    def full(self) -> bool:
+        return self.pending >= self.max_pending
+
+    async def run(self, fn: Callable, *args) -> Any:
+        if self.__slots is None:
+            self.__slots = asyncio.Semaphore(self.max_pending)
+
+        # Backpressure, once the queue is full callers wait here
+        async with self.__slots:
+            self.pending += 1
+            try:
+                loop = asyncio.get_event_loop()
+                return await loop.run_in_executor(self.__pool, fn, *args)
+            finally:
+                self.pending -= 1
+
+    def shutdown(self):
+        self.__pool.shutdown(wait=False)
@@ -1,27 +1,113 @@
-import logging
+import os
 import sys
+import json
+import queue
+import atexit
+import logging
 
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 # Verify if system is macOS
-foldername = Path("./logs")
+foldername = Path(os.getenv("LOG_DIR", "./logs"))
 foldername.mkdir(exist_ok=True)
 
 FILENAME = "log.log"
 PATH = foldername / FILENAME
 FORMAT = "%(asctime)s [%(name)-12s] [%(levelname)-5.5s]  %(message)s"
-DEFAULT_LEVEL = logging.INFO 
+DEFAULT_LEVEL = logging.INFO
+
+# Size based rotation, LOG_BACKUPS older files are kept
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", 5))
+# One JSON object per line in the log file instead of FORMAT
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"
 
 logFormatter = logging.Formatter(FORMAT)
-logging.basicConfig(stream=sys.stderr, format=FORMAT)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+class QueueLogHandler(QueueHandler):
+    # Callers only put the record in a queue, a single background thread
+    # formats and writes it
+    def __init__(self, path: Path, handlers: list) -> None:
+        super().__init__(queue.Queue(-1))
+        self.log_path = str(path)
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.pid = None
+
+        self.start()
+        atexit.register(self.stop)
+
+    def start(self):
+        self.pid = os.getpid()
+        self.listener.start()
+
+    def stop(self):
+        if self.pid == os.getpid():
+            self.listener.stop()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        # The traceback is already part of the message
+        record.exc_text = None
+        return record
+
+    def emit(self, record: logging.LogRecord):
+        # Forked workers (the process report executor) start their own writer
+        if self.pid != os.getpid():
+            self.start()
+
+        super().emit(record)
+
+
+def _find_handler(logger: logging.Logger, path: Path):
+    for handler in logger.handlers:
+        if getattr(handler, "log_path", None) == str(path):
+            return handler
+
+    return None
+
+
+def _make_handler(path: Path, console: bool) -> QueueLogHandler:
+    file_handler = RotatingFileHandler(path,
+                                       maxBytes=LOG_MAX_BYTES,
+                                       backupCount=LOG_BACKUPS,
+                                       encoding="utf-8",
+                                       delay=True)
+    file_handler.setFormatter(JsonFormatter() if LOG_JSON else logFormatter)
+    handlers = [file_handler]
+
+    if console:
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(logFormatter)
+        handlers.append(console_handler)
+
+    return QueueLogHandler(path, handlers)
 
 
 def get_logger(name, path=PATH, level=DEFAULT_LEVEL):
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
-    filename = path
-    fileHandler = logging.FileHandler(filename, mode='a')
-    fileHandler.setFormatter(logFormatter)
-    logger.addHandler(fileHandler)
+    # The default log hangs from the root logger, every module shares its
+    # queue. Handlers are found by path, reloads never add them twice.
+    owner = logging.getLogger() if path == PATH else logger
+
+    if _find_handler(owner, path) is None:
+        owner.addHandler(_make_handler(path, console=owner is logging.getLogger()))
 
     return logger
@@ -0,0 +1,224 @@
+import os
+import time
+import bisect
+import functools
+
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Prometheus text endpoint, METRICS_PORT=0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+
+# Seconds, from a cached answer to a slow upstream
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [*key, extra] if extra is not None else [*key]
+    if len(pairs) == 0:
+        return ""
+
+    escaped = [(name, value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+               for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Counter(object):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.values: Dict[LabelKey, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels):
+        self.values[label_key(labels)] += amount
+
+    def lines(self) -> Iterator[str]:
+        for key, value in self.values.items():
+            yield f"{self.name}{format_labels(key)} {value}"
+
+
+class Histogram(object):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # {labels: [count per bucket..., count over the last bucket]}, sums apart
+        self.counts: Dict[LabelKey, List[int]] = {}
+        self.sums: Dict[LabelKey, float] = defaultdict(float)
+
+    def observe(self, value: float, **labels):
+        key = label_key(labels)
+        counts = self.counts.get(key)
+        if counts is None:
+            counts = self.counts[key] = [0] * (len(self.buckets) + 1)
+
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, key: LabelKey) -> int:
+        return sum(self.counts.get(key, ()))
+
+    def quantile(self, key: LabelKey, q: float) -> float:
+        # Upper bound of the bucket holding the quantile
+        counts = self.counts.get(key)
+        if counts is None:
+            return float("nan")
+
+        target, seen = q * sum(counts), 0
+        for bound, count in zip([*self.buckets, float("inf")], counts):
+            seen += count
+            if seen >= target:
+                return bound
+
+        return float("inf")
+
+    def lines(self) -> Iterator[str]:
+        for key, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels(key, ('le', str(bound)))} {cumulative}"
+            yield f"{self.name}_sum{format_labels(key)} {self.sums[key]}"
+            yield f"{self.name}_count{format_labels(key)} {cumulative}"
+
+
+class Registry(object):
+    def __init__(self) -> None:
+        self.metrics = OrderedDict()
+        # {name: TTLCache}, read when rendering
+        self.caches = OrderedDict()
+        # {name: (help, fn)}, gauges read when rendering
+        self.gauges = OrderedDict()
+
+    # region aux functions
+    def __get(self, cls, name: str, help: str, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, **kwargs)
+        return metric
+
+    def __cache_lines(self) -> Iterator[str]:
+        stats = {name: cache.stats() for name, cache in self.caches.items()}
+        series = [("mrlobot_cache_hits_total", "counter", "hits"),
+                  ("mrlobot_cache_misses_total", "counter", "misses"),
+                  ("mrlobot_cache_evictions_total", "counter", "evictions"),
+                  ("mrlobot_cache_entries", "gauge", "entries"),
+                  ("mrlobot_cache_bytes", "gauge", "bytes")]
+
+        for metric, kind, field in series:
+            yield f"# TYPE {metric} {kind}"
+            for name, values in stats.items():
+                yield f"{metric}{format_labels(label_key({'cache': name}))} {values[field]}"
+    # endregion
+
+    # region externally used
+    def counter(self, name: str, help: str) -> Counter:
+        return self.__get(Counter, name, help)
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = BUCKETS) -> Histogram:
+        return self.__get(Histogram, name, help, buckets=buckets)
+
+    def register_cache(self, name: str, cache):
+        self.caches[name] = cache
+
+    def register_gauge(self, name: str, help: str, fn: Callable[[], float]):
+        self.gauges[name] = (help, fn)
+
+    def render(self) -> str:
+        lines = []
+
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.lines())
+
+        for name, (help, fn) in self.gauges.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {fn()}")
+
+        lines.extend(self.__cache_lines())
+
+        return "\n".join(lines) + "\n"
+    # endregion
+
+
+REGISTRY = Registry()
+
+COMMAND_SECONDS = REGISTRY.histogram("mrlobot_command_seconds",
+                                     "Command handling time by command and status")
+PROVIDER_SECONDS = REGISTRY.histogram("mrlobot_provider_seconds",
+                                      "Provider calls by call and status, cache hits included")
+UPSTREAM_SECONDS = REGISTRY.histogram("mrlobot_upstream_request_seconds",
+                                      "HTTP requests by host, method and status code")
+UPSTREAM_BYTES = REGISTRY.counter("mrlobot_upstream_bytes_total",
+                                  "Response bytes by host")
+UPSTREAM_RETRIES = REGISTRY.counter("mrlobot_upstream_retries_total",
+                                    "Retried HTTP requests by host")
+STAGE_SECONDS = REGISTRY.histogram("mrlobot_stage_seconds",
+                                   "Report stages: queued, compute, upload")
+
+
+def timed(call: str):
+    # Provider coroutines, by outcome
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            status = "error"
+            try:
+                result = await fn(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                PROVIDER_SECONDS.observe(time.perf_counter() - start, call=call, status=status)
+
+        return wrapper
+
+    return decorator
+
+
+async def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[web.AppRunner]:
+    if port == 0:
+        return None
+
+    async def metrics(_):
+        return web.Response(text=REGISTRY.render(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    logger.info(f"Metrics on http://{host}:{port}/metrics")
+
+    return runner
@@ -0,0 +1,172 @@
+import io
+import os
+import time
+import pstats
+import cProfile
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from utils.logger import get_logger
+
+# pyinstrument (>= 4) is optional, the sampling profiler is used when installed
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+    SamplingProfiler = None
+
+logger = get_logger(__name__)
+
+PROFILES_DIR = Path(os.getenv("PROFILES_DIR", "./profiles"))
+# Functions listed in the cProfile summary
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", 40))
+# Calls a single +mrlobot_profile can arm, profiles slow the whole loop down
+PROFILE_MAX_CALLS = int(os.getenv("PROFILE_MAX_CALLS", 10))
+
+
+class ProfileRequest(object):
+    def __init__(self, command: str, remaining: int, channel: Any = None) -> None:
+        self.command = command
+        self.remaining = remaining
+        # Channel the profiles are uploaded to, None keeps them local only
+        self.channel = channel
+
+
+class ProfileSession(NamedTuple):
+    request: ProfileRequest
+    profiler: Any
+    started_at: float
+    # Profiles of the work sent to the report executor, see profile_call
+    workers: List[Any]
+
+
+class WorkerStats(object):
+    # cProfile stats taken in another thread or process, as pstats reads them
+    def __init__(self, stats: dict) -> None:
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def profile_call(sampling: bool, fn: Callable, *args) -> Tuple[Any, Any]:
+    # Profilers only see their own thread, the one on the loop misses the
+    # report executor. (result, profile) with the profile as plain data,
+    # html or cProfile stats, so it works on a process pool as well.
+    if sampling:
+        profiler = SamplingProfiler(async_mode="disabled")
+        profiler.start()
+        try:
+            result = fn(*args)
+        finally:
+            profiler.stop()
+
+        return result, profiler.output_html()
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = fn(*args)
+    finally:
+        profiler.disable()
+
+    profiler.create_stats()
+
+    return result, profiler.stats
+
+
+class CommandProfiler(object):
+    def __init__(self, path: Path = PROFILES_DIR, sampling: bool = SamplingProfiler is not None) -> None:
+        self.path = path
+        self.sampling = sampling
+        # {command: request}, empty unless an admin turned profiling on
+        self.armed: Dict[str, ProfileRequest] = {}
+        self.active: Optional[ProfileSession] = None
+
+    @property
+    def kind(self) -> str:
+        return "pyinstrument" if self.sampling else "cProfile"
+
+    # region aux functions
+    def __write_sampling(self, html: str, base: Path) -> Path:
+        path = base.with_suffix(".html")
+        path.write_text(html, encoding="utf-8")
+
+        return path
+
+    def __write_deterministic(self, source: Any, base: Path) -> Path:
+        # Binary stats for snakeviz and friends, plus a readable summary
+        summary = io.StringIO()
+        stats = pstats.Stats(source, stream=summary)
+        stats.dump_stats(str(base.with_suffix(".prof")))
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+
+        path = base.with_suffix(".txt")
+        path.write_text(summary.getvalue(), encoding="utf-8")
+
+        return path
+    # endregion
+
+    # region externally used
+    def arm(self, command: str, times: int = 1, channel: Any = None) -> int:
+        times = min(max(1, times), PROFILE_MAX_CALLS)
+        self.armed[command] = ProfileRequest(command, times, channel)
+
+        return times
+
+    def disarm(self, command: str) -> bool:
+        return self.armed.pop(command, None) is not None
+
+    def start(self, command: str) -> Optional[ProfileSession]:
+        request = self.armed.get(command)
+
+        # A single profiler at a time, the others run unprofiled
+        if request is None or self.active is not None:
+            return None
+
+        request.remaining -= 1
+        if request.remaining <= 0:
+            del self.armed[command]
+
+        if self.sampling:
+            # The loop thread only, reports made in the executor go through profile_call
+            profiler = SamplingProfiler(async_mode="disabled")
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        self.active = ProfileSession(request, profiler, time.perf_counter(), [])
+
+        return self.active
+
+    def stop(self, session: ProfileSession) -> List[Path]:
+        if self.sampling:
+            session.profiler.stop()
+        else:
+            session.profiler.disable()
+
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            base = self.path / f"{session.request.command}-{time.strftime('%Y%m%d-%H%M%S')}"
+
+            # The loop first, then a file per report made in the executor
+            if self.sampling:
+                paths = [self.__write_sampling(session.profiler.output_html(), base)]
+                paths.extend(self.__write_sampling(html, base.with_name(f"{base.name}-worker{ix}"))
+                             for ix, html in enumerate(session.workers))
+            else:
+                paths = [self.__write_deterministic(session.profiler, base)]
+                paths.extend(self.__write_deterministic(WorkerStats(stats),
+                                                        base.with_name(f"{base.name}-worker{ix}"))
+                             for ix, stats in enumerate(session.workers))
+
+            logger.info(f"Profile of {session.request.command} saved to {', '.join(map(str, paths))}")
+
+            return paths
+        except Exception as ex:
+            logger.error(ex)
+            raise
+        finally:
+            self.active = None
+    # endregion
@@ -0,0 +1,66 @@
+import io
+import zipfile
+
+import pandas as pd
+
+from typing import List, NamedTuple, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class RenderedFile(NamedTuple):
+    # Stats bundled in the file
+    stats: Tuple[str, ...]
+    filename: str
+    content: bytes
+
+
+def to_csv(sheet: pd.DataFrame) -> bytes:
+    return sheet.to_csv(index=False).encode("utf-8")
+
+
+def render_csv(name: str, sheets: List[Tuple[str, pd.DataFrame]]) -> List[RenderedFile]:
+    # One file per stat
+    return [RenderedFile((stat,), f"{name}_{stat}.csv", to_csv(sheet))
+            for stat, sheet in sheets]
+
+
+def render_xlsx(name: str, sheets: List[Tuple[str, pd.DataFrame]]) -> List[RenderedFile]:
+    # A single workbook with a worksheet per stat
+    buffer = io.BytesIO()
+
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        for stat, sheet in sheets:
+            sheet.to_excel(writer, sheet_name=stat, index=False)
+
+    stats = tuple(stat for stat, _ in sheets)
+    return [RenderedFile(stats, f"{name}.xlsx", buffer.getvalue())]
+
+
+def render_zip(name: str, sheets: List[Tuple[str, pd.DataFrame]]) -> List[RenderedFile]:
+    # The csv files of every stat in a single archive
+    buffer = io.BytesIO()
+
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for stat, sheet in sheets:
+            archive.writestr(f"{name}_{stat}.csv", to_csv(sheet))
+
+    stats = tuple(stat for stat, _ in sheets)
+    return [RenderedFile(stats, f"{name}.zip", buffer.getvalue())]
+
+
+RENDERERS = {
+    "csv": render_csv,
+    "xlsx": render_xlsx,
+    "zip": render_zip,
+}
+
+
+def render(name: str, sheets: List[Tuple[str, pd.DataFrame]], fmt: str = "csv") -> List[RenderedFile]:
+    try:
+        return RENDERERS[fmt](name, sheets)
+    except Exception as ex:
+        logger.error(ex)
+        raise
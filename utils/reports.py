@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from providers.roster import Roster
+from utils.logger import get_logger
+from utils.render import RenderedFile, render
+
+logger = get_logger(__name__)
+
+
+# Each stat is a column expression over the roster long table
+def pg(units: pd.DataFrame) -> pd.Series:
+    return units["power"].astype(np.int32)
+
+
+def relic(units: pd.DataFrame) -> pd.Series:
+    return (units["relic_tier"].astype(np.int32) - 2).clip(lower=0)
+
+
+def def_processor(sheet: pd.DataFrame) -> pd.DataFrame:
+    sheet = sheet.fillna(0)
+    data_cols = sheet.columns[1:]
+    temp = sheet[data_cols].astype("int32")
+    sheet[data_cols] = temp
+
+    return sheet
+
+
+REPORT_MAPPER = {
+    "pg": pg,
+    "relic": relic,
+}
+
+SHEET_PROCESSOR = {
+    "pg": def_processor,
+    "relic": def_processor,
+}
+
+
+class ReportState(NamedTuple):
+    # fetched_at of the roster the state was computed from
+    version: float
+    # Player keys and names, in roster order
+    keys: List[str]
+    players: List[str]
+    # Long table indexed by (key, base_id) with a column per stat
+    table: pd.DataFrame
+    # {stat: wide sheet (key x base_id)} for every unit of the guild
+    sheets: Dict[str, pd.DataFrame]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.table.memory_usage(deep=True).sum()) + \
+            sum(int(sheet.memory_usage(deep=True).sum()) for sheet in self.sheets.values())
+
+
+class RosterDiff(NamedTuple):
+    joined: List[str]
+    left: List[str]
+    # Rows (player, base_id, stat, old, new) for the units that changed
+    changed: pd.DataFrame
+
+    @property
+    def empty(self) -> bool:
+        return len(self.joined) == 0 and len(self.left) == 0 and len(self.changed) == 0
+
+
+def flatten(roster: Roster) -> pd.DataFrame:
+    keys = np.array(roster.keys, dtype=object)
+    units = roster.units
+
+    table = pd.DataFrame({stat: mapper(units).to_numpy()
+                          for stat, mapper in REPORT_MAPPER.items()})
+    table.index = pd.MultiIndex.from_arrays([keys[units["player"].to_numpy()],
+                                             units["base_id"].astype(str).to_numpy()],
+                                            names=["key", "base_id"])
+
+    # A unit is listed once per player, just in case
+    return table[~table.index.duplicated()]
+
+
+def build_state(roster: Roster) -> ReportState:
+    try:
+        table = flatten(roster)
+        sheets = {stat: table[stat].unstack("base_id", fill_value=0).astype(np.int32)
+                  for stat in REPORT_MAPPER}
+
+        return ReportState(version=roster.fetched_at,
+                           keys=roster.keys,
+                           players=roster.players,
+                           table=table,
+                           sheets=sheets)
+    except Exception as ex:
+        logger.error(ex)
+        raise
+
+
+def diff_states(old: ReportState, new: ReportState) -> RosterDiff:
+    # Only +mrlobot_changes needs it, reports always pivot the whole roster
+    try:
+        common = old.table.index.intersection(new.table.index)
+        before, after = old.table.loc[common], new.table.loc[common]
+        added = new.table.index.difference(old.table.index)
+
+        old_keys, new_keys = set(old.keys), set(new.keys)
+        joined = [key for key in new.keys if key not in old_keys]
+        left = [key for key in old.keys if key not in new_keys]
+
+        names = dict(zip(new.keys, new.players))
+        old_names = dict(zip(old.keys, old.players))
+
+        # Units new to a player are listed as coming from 0
+        unlocked = new.table.loc[added]
+        unlocked = unlocked[unlocked.index.get_level_values("key").isin(old_keys)]
+
+        changes = []
+        for stat in REPORT_MAPPER:
+            diff = (before[stat] != after[stat]).to_numpy()
+            for (key, base_id), was, now in zip(common[diff], before[stat][diff], after[stat][diff]):
+                changes.append((names.get(key), base_id, stat, was, now))
+            for (key, base_id), now in unlocked[stat].items():
+                changes.append((names.get(key), base_id, stat, 0, now))
+
+        logger.info(f"Roster diff: {len(joined)} joined, {len(left)} left, "
+                    f"{len(changes)} changes")
+
+        return RosterDiff(joined=[names[key] for key in joined],
+                          left=[old_names[key] for key in left],
+                          changed=pd.DataFrame(changes,
+                                               columns=["player", "base_id", "stat", "old", "new"]))
+    except Exception as ex:
+        logger.error(ex)
+        raise
+
+
+def build_sheets(state: ReportState,
+                 base_ids: List[str],
+                 unit_names: Dict[str, str],
+                 stat_opts: List[str]) -> List[Tuple[str, pd.DataFrame]]:
+    try:
+        columns = ["PLAYER", *[unit_names.get(base_id, base_id)
+                               for base_id in base_ids]]
+        mrlobot_sheets = []
+
+        for stat in stat_opts:
+            # Every player gets a row, even without any of the units
+            temp = state.sheets[stat].reindex(index=state.keys, columns=base_ids)
+            temp.insert(0, "PLAYER", state.players)
+            temp.columns = columns
+            temp = temp.reset_index(drop=True)
+
+            mrlobot_sheets.append(
+                (stat, SHEET_PROCESSOR[stat](temp))
+            )
+
+        return mrlobot_sheets
+    except Exception as ex:
+        logger.error(ex)
+        raise
+
+
+def make_report(state: Optional[ReportState],
+                roster: Roster,
+                base_ids: List[str],
+                unit_names: Dict[str, str],
+                stat_opts: List[str],
+                name: str,
+                fmt: str) -> Tuple[ReportState, List[RenderedFile]]:
+    # The whole CPU bound part of a report, it runs in the report executor.
+    # Arguments and results are plain data so it works on a process pool.
+    # A pivot of the new roster is cheaper than patching the previous one.
+    if state is None or state.version != roster.fetched_at:
+        state = build_state(roster)
+
+    sheets = build_sheets(state=state,
+                          base_ids=base_ids,
+                          unit_names=unit_names,
+                          stat_opts=stat_opts)
+
+    return state, render(name, sheets, fmt)
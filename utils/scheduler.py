@@ -0,0 +1,219 @@
+import os
+import time
+import asyncio
+
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Hashable, Optional, Tuple
+
+from utils.logger import get_logger
+from utils.exc import RateLimitException
+from utils.metrics import STAGE_SECONDS
+
+logger = get_logger(__name__)
+
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", 4))
+# Reports a Discord server can ask for, burst and refill per minute
+SERVER_BURST = float(os.getenv("SCHEDULER_SERVER_BURST", 5))
+SERVER_PER_MINUTE = float(os.getenv("SCHEDULER_SERVER_PER_MINUTE", 5))
+# Reports of a swgoh guild started against upstream, burst and refill per minute
+GUILD_BURST = float(os.getenv("SCHEDULER_GUILD_BURST", 3))
+GUILD_PER_MINUTE = float(os.getenv("SCHEDULER_GUILD_PER_MINUTE", 3))
+
+
+class TokenBucket(object):
+    def __init__(self, capacity: float, per_minute: float) -> None:
+        self.capacity = capacity
+        self.rate = per_minute / 60
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def __refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        self.__refill()
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+
+        return False
+
+    def wait_time(self, tokens: float = 1) -> float:
+        # Seconds until that many tokens are available
+        self.__refill()
+        return max(0, (tokens - self.tokens) / self.rate) if self.rate > 0 else float("inf")
+
+
+class Job(object):
+    def __init__(self, srvr: str, guild: str, key: Hashable, fn: Callable[[], Awaitable],
+                 upstream: Optional[Callable[[], bool]] = None) -> None:
+        self.srvr = srvr
+        self.guild = guild
+        self.key = key
+        self.fn = fn
+        # Whether the job has to reach swgoh.gg, only those use the guild limit
+        self.upstream = upstream or (lambda: True)
+        self.future = asyncio.get_event_loop().create_future()
+        # Estimated jobs to run before this one when it was queued
+        self.ahead = 0
+        self.queued_at = time.monotonic()
+
+    def __await__(self):
+        return asyncio.shield(self.future).__await__()
+
+
+class FairScheduler(object):
+    def __init__(self,
+                 workers: int = SCHEDULER_WORKERS,
+                 server_burst: float = SERVER_BURST,
+                 server_per_minute: float = SERVER_PER_MINUTE,
+                 guild_burst: float = GUILD_BURST,
+                 guild_per_minute: float = GUILD_PER_MINUTE) -> None:
+        self.workers = workers
+        self.server_burst = server_burst
+        self.server_per_minute = server_per_minute
+        self.guild_burst = guild_burst
+        self.guild_per_minute = guild_per_minute
+
+        # {srvr: deque(jobs)}, servers are served round robin in this order
+        self.__queues = OrderedDict()
+        # {key: job} queued or running, to deduplicate requests
+        self.__jobs = {}
+        self.__server_buckets = {}
+        self.__guild_buckets = {}
+
+        self.__tasks = []
+        self.__wakeup = None
+        self.running = 0
+
+    # region aux functions
+    def __bucket(self, buckets: dict, key: str, burst: float, per_minute: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(burst, per_minute)
+        return bucket
+
+    def __guild_bucket(self, job: Job) -> TokenBucket:
+        return self.__bucket(self.__guild_buckets, job.guild,
+                             self.guild_burst, self.guild_per_minute)
+
+    def __start(self):
+        # Lazily, workers have to live inside the running loop
+        if len(self.__tasks) == 0:
+            self.__wakeup = asyncio.Event()
+            self.__tasks = [asyncio.ensure_future(self.__worker())
+                            for _ in range(self.workers)]
+
+    def __next_job(self) -> Tuple[Optional[Job], float]:
+        # Next job in round robin whose guild can start, else the time to wait
+        wait = float("inf")
+
+        for srvr in [*self.__queues]:
+            queue = self.__queues[srvr]
+            job = queue[0]
+            bucket = self.__guild_bucket(job)
+
+            # Answered from cache, swgoh.gg is not asked so it never waits
+            if not job.upstream() or bucket.try_take():
+                queue.popleft()
+                # The server goes to the back of the line
+                del self.__queues[srvr]
+                if len(queue) > 0:
+                    self.__queues[srvr] = queue
+
+                return job, 0
+
+            wait = min(wait, bucket.wait_time())
+
+        return None, wait
+
+    async def __worker(self):
+        while True:
+            job, wait = self.__next_job()
+
+            if job is None:
+                self.__wakeup.clear()
+                try:
+                    timeout = None if wait == float("inf") else wait
+                    await asyncio.wait_for(self.__wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            STAGE_SECONDS.observe(time.monotonic() - job.queued_at, stage="queued")
+            self.running += 1
+            try:
+                result = await job.fn()
+                if not job.future.done():
+                    job.future.set_result(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                if not job.future.done():
+                    job.future.set_exception(ex)
+            finally:
+                self.running -= 1
+                self.__jobs.pop(job.key, None)
+
+    def __ahead(self, srvr: str) -> int:
+        # Round robin estimate: each other server runs as many jobs as this one
+        position = len(self.__queues.get(srvr, ())) - 1
+        others = sum(min(len(queue), position + 1)
+                     for other, queue in self.__queues.items() if other != srvr)
+
+        return position + others
+    # endregion
+
+    # region externally used
+    def submit(self, srvr: str, guild: str, key: Hashable, fn: Callable[[], Awaitable],
+               upstream: Optional[Callable[[], bool]] = None) -> Tuple[Job, bool]:
+        # (job, is_new), duplicated keys get the job already queued
+        self.__start()
+
+        job = self.__jobs.get(key)
+        if job is not None:
+            return job, False
+
+        bucket = self.__bucket(self.__server_buckets, str(srvr),
+                               self.server_burst, self.server_per_minute)
+        if not bucket.try_take():
+            raise RateLimitException(f"**Mr.Lobot** got too many reports from this server, "
+                                     f"try again in {int(bucket.wait_time()) + 1} seconds")
+
+        job = Job(str(srvr), str(guild), key, fn, upstream)
+        self.__jobs[key] = job
+        self.__queues.setdefault(str(srvr), deque()).append(job)
+        job.ahead = self.__ahead(str(srvr))
+
+        self.__wakeup.set()
+
+        return job, True
+
+    def guild_wait(self, job: Job) -> float:
+        # Seconds the guild limit holds the job back, 0 when it can start.
+        # Older jobs of the same guild take their tokens first.
+        if not job.upstream():
+            return 0
+
+        ahead = sum(1 for queue in self.__queues.values() for other in queue
+                    if other is not job and other.guild == job.guild
+                    and other.queued_at <= job.queued_at and other.upstream())
+
+        return self.__guild_bucket(job).wait_time(ahead + 1)
+
+    @property
+    def busy(self) -> bool:
+        return self.running >= self.workers
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.__queues.values())
+
+    def close(self):
+        for task in self.__tasks:
+            task.cancel()
+        self.__tasks = []
+    # endregion